@@ -3,193 +3,1267 @@
 #and the origin of the bolt is created. The code then loops through the attractors and finds the closest lightning segment, wich will then be attracted. The bolt grows until all of the attractors 
 #are reached and removed. The GUI allows the user to change the appearence, size, orientation, colour and brightness of the lightning. This code should be used to create a lightning 
 #mesh that can then be exported into the users scene where its needed.
+#Outside of Maya the script can be run from the command line with Python to benchmark the growth, see commandLineFunc().
 #
 #Main reference: Runions, A., Lane, B., Prusinkiewicz, P. (2007) "Modelling Trees with a Space Colonization Algorithm". Canada: University of Calgary
 
-import maya.cmds as cmds
 import random
-from maya.OpenMaya import MVector, MPoint
+import math
+import sys
+import os
+import time
+import tempfile
+import zipfile
+import json
+import array
+import argparse
+import collections
+import itertools
+import multiprocessing
+import subprocess
+import threading
+try:
+    import tracemalloc #tracemalloc is only used by the benchmark to measure the peak memory, and doesn't exist in Python 2
+except ImportError:
+    tracemalloc = None
+try:
+    import maya.cmds as cmds
+    import maya.api.OpenMaya as om2
+    import maya.api.OpenMayaAnim as oma2
+    import maya.utils
+except ImportError: #outside of Maya the growth can still be run with the RecordingBackend, for example by the benchmark
+    cmds = None
+try:
+    import numpy as np #numpy is optional: it is only needed by the 'numpy' growth engine
+except ImportError:
+    np = None
 
+class Vector: #this class is a pure Python replacement for Maya's MVector and MPoint, so that the growth doesn't depend on Maya
+    __slots__ = ('x', 'y', 'z') #thousands of vectors are created, so they don't need a dictionary each
+    
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        ''' Initialises the objects attributes
+        
+        x, y, z           : the components of the vector
+        On exit           : the attributes have been set
+        '''
+        self.x = float(x)
+        self.y = float(y)
+        self.z = float(z)
+        
+    def __add__(self, other):
+        return Vector(self.x+other.x, self.y+other.y, self.z+other.z)
+        
+    def __iadd__(self, other):
+        self.x += other.x
+        self.y += other.y
+        self.z += other.z
+        return self
+        
+    def __sub__(self, other):
+        return Vector(self.x-other.x, self.y-other.y, self.z-other.z)
+        
+    def __mul__(self, value):
+        return Vector(self.x*value, self.y*value, self.z*value)
+        
+    def __itruediv__(self, value):
+        self.x /= value
+        self.y /= value
+        self.z /= value
+        return self
+    __idiv__ = __itruediv__ #the same operator in Python 2, used by older versions of Maya
+        
+    def length(self):
+        return math.sqrt(self.x*self.x + self.y*self.y + self.z*self.z)
+        
+    def distanceTo(self, other):
+        ''' Returns the distance between two positions, like MPoint.distanceTo
+        '''
+        return math.sqrt((self.x-other.x)*(self.x-other.x) + (self.y-other.y)*(self.y-other.y) + (self.z-other.z)*(self.z-other.z))
+        
+    def normalize(self):
+        ''' Makes the length of the vector 1, like MVector.normalize
+        '''
+        length = self.length()
+        if (length > 0): #Error checking: a vector of length zero can't be normalized
+            self.x /= length
+            self.y /= length
+            self.z /= length
+        return self
+        
 class Point: #this class is used to create the attractors
-    def __init__(self, area):
+    def __init__(self, area, rng=random):
         ''' Initialises the objects attributes
         
         self              : the instance of the class
         area              : the area in which to spawn the attractors, from the GUI
+        rng               : the random number generator, the random module or a seeded random.Random of the bolt
         On exit           : the attributes have been set
         '''
-        self.pos = MPoint(random.uniform(-area,area), random.uniform(0,40), random.uniform(-area,area)) #the position of each point is randomly generated in an area decided by the user
+        self.pos = Vector(rng.uniform(-area,area), rng.uniform(0,40), rng.uniform(-area,area)) #the position of each point is randomly generated in an area decided by the user
         self.reached = False #the reached flag signals if a point has been reached by a segment   
         
-class Line: #this class is used to create bolt segments
-    def __init__(self, pos, father, dir):
+class Line: #this class is used to access the bolt segments. It is a view of one segment of a SegmentStore, so it has the same attributes as a segment object but keeps nothing itself
+    __slots__ = ('store', 'index')
+    
+    def __init__(self, store, index):
         ''' Initialises the objects attributes
         
-        pos               : the position in the 3D space of the segment
-        father            : a reference to the previous segment
-        dir               : the segments direction
+        store             : the SegmentStore containing the segment
+        index             : the index of the segment in the store
         On exit           : the attributes have been set
         '''
-        self.pos = pos
-        self.father = father
-        self.dir = dir
-        self.count = 0 #used to average the direction
-        self.originalDir = MVector(self.dir.x, self.dir.y, self.dir.z) #the original direction is stored
-        self.length = 1 #the length of the segment
-        self.shown = False #a flag to keep count of which segments have been shown
-        self.frame = 0 #the frame at which each segment becomes visible
+        self.store = store
+        self.index = index
         
-        '''Source: reference from The Coding Train''' 
+    def getPos(self):
+        return self.store.position(self.index)
+    def setPos(self, pos):
+        self.store.positions[3*self.index:3*self.index+3] = array.array('d', (pos.x, pos.y, pos.z))
+    pos = property(getPos, setPos) #the position in the 3D space of the segment
+    
+    def getDir(self):
+        return Vector(*self.store.dirs[3*self.index:3*self.index+3])
+    def setDir(self, dir):
+        self.store.setDirection(self.index, dir.x, dir.y, dir.z)
+    dir = property(getDir, setDir) #the segments direction. A copy is returned, so 'segm.dir += newDir' stores the sum back through the setter
+    
+    def getOriginalDir(self):
+        return Vector(*self.store.originalDirs[3*self.index:3*self.index+3])
+    originalDir = property(getOriginalDir) #the original direction
+    
+    def getFather(self):
+        father = self.store.parents[self.index]
+        return None if father < 0 else Line(self.store, father)
+    father = property(getFather) #the previous segment, None for the origin
+    
+    def getCount(self):
+        return self.store.counts[self.index]
+    def setCount(self, count):
+        self.store.counts[self.index] = count
+    count = property(getCount, setCount) #used to average the direction
+    
+    def getFrame(self):
+        return self.store.frames[self.index]
+    def setFrame(self, frame):
+        self.store.frames[self.index] = frame
+    frame = property(getFrame, setFrame) #the frame at which each segment becomes visible
+    
+    def getShown(self):
+        return bool(self.store.shown[self.index])
+    def setShown(self, shown):
+        self.store.shown[self.index] = 1 if shown else 0
+    shown = property(getShown, setShown) #a flag to keep count of which segments have been shown
+    
+    length = 1 #the length of the segment
+    
     def resetFunc(self):
         '''  Resets the count and direction after the count is used to average the direction of a new segment
         
         On exit           : the count and direction have been reset                
         '''
-        self.dir = MVector(self.originalDir.x, self.originalDir.y, self.originalDir.z)
-        self.count = 0
+        self.store.reset(self.index)
                 
     def next(self):
-        ''' Creates the various segments, which are instances of the Line class
+        ''' Creates the next segment, which is added to the store
         
         return           : returns the created segment
         '''
-        nextDir = (self.dir * self.length)
-        nextPos = (self.pos + nextDir) #the position of the next segment is found by adding the direction vector
-        nextSegm = Line(nextPos, self, MVector(self.dir.x, self.dir.y, self.dir.z)) #the Line class is used for a new instance
-        return nextSegm 
+        return Line(self.store, self.store.next(self.index))
+        
+class SegmentStore: #this class keeps the segments of a bolt in flat arrays instead of one object each, so that a bolt with a lot of segments uses little memory
+    def __init__(self):
+        ''' Initialises the objects attributes
+        
+        On exit           : the attributes have been set
+        '''
+        self.positions = array.array('d') #the x, y, z of every segment one after the other
+        self.dirs = array.array('d') #the direction of every segment, which the attractors are added to
+        self.originalDirs = array.array('d') #the direction every segment was created with
+        self.counts = array.array('i') #the number of attractors of every segment, used to average the direction
+        self.parents = array.array('i') #the index of the father of every segment, -1 for the origin
+        self.frames = array.array('i') #the frame at which every segment becomes visible
+        self.shown = array.array('b') #1 for the segments that have been shown
+        self.length = 1 #the length of the segments
+        
+    def __len__(self):
+        return len(self.parents)
+        
+    def __getitem__(self, i):
+        ''' Returns a Line view of a segment, so that the store can be used like the list of segments
+        '''
+        if (i < 0):
+            i += len(self.parents)
+        if (i < 0 or i >= len(self.parents)):
+            raise IndexError('segment index out of range')
+        return Line(self, i)
+        
+    def add(self, pos, parent, dir):
+        ''' Adds a segment
+        
+        pos               : the position in the 3D space of the segment
+        parent            : the index of the previous segment, None for the origin
+        dir               : the segments direction
+        return            : returns the index of the segment
+        '''
+        self.positions.extend((pos.x, pos.y, pos.z))
+        self.dirs.extend((dir.x, dir.y, dir.z))
+        self.originalDirs.extend((dir.x, dir.y, dir.z))
+        self.counts.append(0)
+        self.parents.append(-1 if parent is None else parent)
+        self.frames.append(0)
+        self.shown.append(0)
+        return len(self.parents)-1
+        
+    def position(self, i):
+        ''' Returns the position of a segment as a Vector
+        '''
+        return Vector(self.positions[3*i], self.positions[3*i+1], self.positions[3*i+2])
+        
+    def setDirection(self, i, x, y, z):
+        ''' Sets the direction of a segment
+        '''
+        k = 3*i
+        self.dirs[k] = x
+        self.dirs[k+1] = y
+        self.dirs[k+2] = z
+        
+    def attract(self, i, pos):
+        ''' Adds the normalized direction towards an attractor to the direction of a segment, and counts the attractor
+        
+        i                 : the index of the segment
+        pos               : the position of the attractor
+        return            : returns the number of attractors of the segment
+        '''
+        k = 3*i
+        x = pos.x-self.positions[k]
+        y = pos.y-self.positions[k+1]
+        z = pos.z-self.positions[k+2] #the new direction is towards the attractor
+        length = math.sqrt(x*x + y*y + z*z)
+        if (length > 0): #the direction gets normalized, like Vector.normalize
+            x /= length
+            y /= length
+            z /= length
+        self.dirs[k] += x
+        self.dirs[k+1] += y
+        self.dirs[k+2] += z
+        self.counts[i] += 1
+        return self.counts[i]
+        
+    def average(self, i, rand):
+        ''' Averages the directions of a segment to its attractors and adds a random factor
+        
+        i                 : the index of the segment
+        rand              : the x, y, z of the random factor
+        On exit           : the direction has been averaged and normalized
+        '''
+        k = 3*i
+        count = self.counts[i]
+        x = self.dirs[k]/count + rand[0]
+        y = self.dirs[k+1]/count + rand[1]
+        z = self.dirs[k+2]/count + rand[2]
+        length = math.sqrt(x*x + y*y + z*z)
+        if (length > 0):
+            x /= length
+            y /= length
+            z /= length
+        self.setDirection(i, x, y, z)
+        
+    '''Source: reference from The Coding Train''' 
+    def reset(self, i):
+        '''  Resets the count and direction after the count is used to average the direction of a new segment
+        
+        i                 : the index of the segment
+        On exit           : the count and direction have been reset                
+        '''
+        k = 3*i
+        self.dirs[k:k+3] = self.originalDirs[k:k+3]
+        self.counts[i] = 0
+        
+    def next(self, i):
+        ''' Creates the next segment of a segment, one length along its direction
+        
+        i                 : the index of the segment
+        return            : returns the index of the created segment
+        '''
+        k = 3*i
+        dirX, dirY, dirZ = self.dirs[k], self.dirs[k+1], self.dirs[k+2]
+        self.positions.extend((self.positions[k] + dirX*self.length, self.positions[k+1] + dirY*self.length, self.positions[k+2] + dirZ*self.length)) #the position of the next segment is found by adding the direction vector
+        self.dirs.extend((dirX, dirY, dirZ))
+        self.originalDirs.extend((dirX, dirY, dirZ))
+        self.counts.append(0)
+        self.parents.append(i)
+        self.frames.append(0)
+        self.shown.append(0)
+        return len(self.parents)-1
         '''End of referenced code'''
-               
-    def showMesh(self, iter, cylinderNumber, newThickness, segmFalloff):
-        ''' Shows a small cylinder for every lightning segment, except for the origin, and is also responsable for the animation
-        
-        iter             : the current number of iterations, used to set the correct frame
-        cylinderNumber   : the number of each segment, assigned when the cylinder is renamed
-        newThickness     : the initial radius of the lightning segments, from the GUI
-        segmFalloff      : boolean that decides if the radius decreases as the lightning grows, from the GUI
-        On exit          : the cylinders are placed and are animated being created
-        '''
-        if (self.father is not None): #this line makes sure the origin segment is not shown
-            if (self.shown == False): #this line makes sure to only show the new segments created in the frame
-                p1 = self.pos
-                p2 = self.father.pos
-                midpointX = (p1.x + p2.x)/2
-                midpointY = (p1.y + p2.y)/2
-                midpointZ = (p1.z + p2.z)/2 #these operations find the position of where to place the cylinder by keeping count of the parent
-                radiusDecrease = iter*0.001 #based on the frame number, the radius decreases by a certain amount
-                if (segmFalloff == False): #the radius decrease can also be turned off by the user: segmFalloff comes from the GUI
-                    radiusDecrease=0
-                radius = (0.1 - (radiusDecrease))
-                if (radius <= 0): #Error checking: if the radius gets smaller than zero, it gets set to a positive value
-                    radius = 0.0001
-                cmds.polyCylinder(r=radius*newThickness, h=p1.distanceTo(p2), ax=[self.dir.x, self.dir.y, self.dir.z], sx=12) #the cylinder is created with a thickness multiplier from the GUI that controls the radius of the segments
-                cmds.rename('segment_'+(str(cylinderNumber))) #each cylinder is renamed based on its number and then moved to its location
-                cmds.move(midpointX, midpointY, midpointZ)
+        
+class ProfilerScope: #this class times one phase of the generation, see Profiler.phase
+    __slots__ = ('profiler', 'name', 'args', 'start')
+    
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+        
+    def __enter__(self):
+        self.start = self.profiler.clock()
+        return self
+        
+    def __exit__(self, *exception):
+        self.profiler.add(self.name, self.start, self.profiler.clock()-self.start, self.args)
+        
+class NullScope: #the scope returned while the profiler is off, so that the timed phases cost almost nothing
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, *exception):
+        return False
+        
+class CommandCounter: #this class stands in for maya.cmds while the profiler is on, and counts the calls of every command
+    def __init__(self, commands, profiler):
+        self.commands = commands
+        self.profiler = profiler
+        
+    def __getattr__(self, name):
+        command = getattr(self.commands, name)
+        profiler = self.profiler
+        def countedCommand(*args, **kwargs):
+            profiler.commands[name] += 1
+            return command(*args, **kwargs)
+        return countedCommand
+        
+class Profiler: #this class collects the time of every phase of the generation, the calls of the Maya commands and the size of the bolt at every iteration
+    def __init__(self, path=None):
+        ''' Initialises the objects attributes
+        
+        path              : the file the profile is written to, see write. If it is given the profiler is on from the start, for example from the LIGHTNING_PROFILE environment variable
+        On exit           : the attributes have been set
+        '''
+        self.clock = getattr(time, 'perf_counter', time.time)
+        self.path = path
+        self.enabled = False
+        self.nullScope = NullScope()
+        self.reset()
+        if (path):
+            self.start()
+            
+    def reset(self):
+        ''' Removes everything that was collected
+        '''
+        self.origin = self.clock() #the time the events are measured from
+        self.events = [] #every timed phase, as (name, start, duration, args)
+        self.phases = {} #the number of calls and the total time of every phase
+        self.commands = collections.Counter() #the number of calls of every Maya command
+        self.iterations = [] #the number of segments and attractors after every iteration of the growth
+        
+    def start(self):
+        ''' Turns the profiler on. Inside of Maya the commands are counted by putting a CommandCounter in place of maya.cmds
+        '''
+        global cmds
+        self.enabled = True
+        if (cmds is not None and not isinstance(cmds, CommandCounter)):
+            cmds = CommandCounter(cmds, self)
+            
+    def stop(self):
+        ''' Turns the profiler off and puts maya.cmds back
+        '''
+        global cmds
+        self.enabled = False
+        if (isinstance(cmds, CommandCounter)):
+            cmds = cmds.commands
+            
+    def phase(self, name, **args):
+        ''' Returns a scope that times a phase, used as: with profiler.phase('attraction', iteration=i):
+        
+        name              : the name of the phase
+        args              : values stored with the event, shown by the Chrome trace viewer
+        '''
+        if (not self.enabled):
+            return self.nullScope
+        return ProfilerScope(self, name, args)
+        
+    def add(self, name, start, duration, args):
+        ''' Stores a timed phase
+        '''
+        self.events.append((name, start-self.origin, duration, args))
+        total = self.phases.setdefault(name, [0, 0.0])
+        total[0] += 1
+        total[1] += duration
+        
+    def iteration(self, iteration, segments, attractors):
+        ''' Stores the size of the bolt at the end of an iteration of the growth
+        '''
+        if (self.enabled):
+            self.iterations.append({'iteration': iteration, 'time': self.clock()-self.origin, 'segments': segments, 'attractors': attractors})
+            
+    def report(self):
+        ''' Returns everything that was collected as a dictionary
+        '''
+        return {'phases': dict((name, {'calls': total[0], 'time': total[1]}) for name, total in self.phases.items()),
+                'commands': dict(self.commands), 'iterations': self.iterations}
                 
-                self.frame = iter #this section creates the animation by manipulating the visibility attribute of the segments. Each segment has a frame attribute for when it will be made visible
-                cmds.setKeyframe('segment_'+(str(cylinderNumber)), attribute='visibility', value=0, time=self.frame-1)
-                cmds.setKeyframe('segment_'+(str(cylinderNumber)), attribute='visibility', value=1, time=self.frame)
-                self.shown = True #the new segment is flagged as shown so that it won't be considered in the next iteration
-                           
-    def unshowMesh(self, minIter, cylinderNumber):
-        '''  Hides the segments later in the animation, so that the sequence loops
-        
-        minIter          : the first frame at which the lightning starts disappearing
-        cylinderNumber   : the number of each segment
-        return           : returns the value of the frame, but only the last one is used
-        '''
-        if (self.father is not None):
-            self.frame += minIter #the animation is practically reversed. The segments disappear with an offset of minIter from when they were initially made visible
-            cmds.setKeyframe('segment_'+(str(cylinderNumber)), attribute='visibility', value=1, time=self.frame-1)
-            cmds.setKeyframe('segment_'+(str(cylinderNumber)), attribute='visibility', value=0, time=self.frame)
-            return(self.frame) #returning the frame is necessary so that the last one is used to set the end of the animation
-                  
-    def setMaterial(self, iter, cylinderNumber, colour, brightnessDivider, brFalloff, colFalloff, materialType='surfaceShader'):
-        ''' Sets the colour and glow of each segment using nodes and surface shaders
+    def chromeTrace(self):
+        ''' Returns the events in the Chrome trace format, which can be opened in chrome://tracing or Perfetto
+        '''
+        traceEvents = []
+        for name, start, duration, args in self.events:
+            traceEvents.append({'name': name, 'ph': 'X', 'ts': start*1e6, 'dur': duration*1e6, 'pid': 1, 'tid': 1, 'args': args}) #the times are in microseconds
+        for iteration in self.iterations: #the size of the bolt is shown as a counter track
+            traceEvents.append({'name': 'bolt', 'ph': 'C', 'ts': iteration['time']*1e6, 'pid': 1, 'args': {'segments': iteration['segments'], 'attractors': iteration['attractors']}})
+        return {'traceEvents': traceEvents, 'otherData': {'commands': dict(self.commands)}}
+        
+    def write(self, path=None):
+        ''' Writes the profile to a file: a path ending in .trace.json gets the Chrome trace format, any other path the report
+        
+        path              : the path of the file, the one given to the profiler if it is None
+        On exit           : the file has been written
+        '''
+        path = path or self.path
+        with open(path, 'w') as jsonFile:
+            json.dump(self.chromeTrace() if path.endswith('.trace.json') else self.report(), jsonFile, indent=None if path.endswith('.trace.json') else 2)
             
-        iter             : the current number of iterations, used to set colour and brightness decrease
-        cylinderNumber   : the number of each segment
-        colour           : the colour decided by the user, from the GUI
-        brightnessDivider: the brightness value, from the GUI
-        brFalloff        : boolean that decides if the brightness decreases as the lightning grows, from the GUI
-        colFalloff       : boolean that decides if the colour value decreases as the lightning grows, from the GUI 
-        materialType     : the type of shader used
-        On exit          : for each segment a different surface shader is assigned         
-        '''
-        if (self.father is not None):
-            colourChange = iter*0.003 #similarly to the radius, the colour and glow values decrease as the lightning grows
-            brightnessChange = colourChange
-            setName = cmds.sets(name='_MaterialGroup_', renderable=True, empty=True) #creates a new shading node
-            shaderName = cmds.shadingNode(materialType, asShader=True)
-            if (colFalloff == False): #the colour decrease can also be turned off by the user: colFalloff comes from the GUI 
-                colourChange=0
-            cmds.setAttr(shaderName+'.outColor', colour[0]-colourChange, colour[1]-colourChange, colour[2]-colourChange, type='double3') #changes the colour
-            if (brightnessDivider == 0.0):  #if the brightness from the GUI is zero, then don't set the glow attribute
-                cmds.surfaceShaderList(shaderName, add=setName)
-                cmds.sets('segment_'+(str(cylinderNumber)), edit=True, forceElement=setName)
+    def printSummary(self):
+        ''' Prints the phases from the slowest to the fastest and the most called commands
+        '''
+        print('%-14s %8s %10s' % ('phase', 'calls', 'time (s)'))
+        for name, total in sorted(self.phases.items(), key=lambda item: -item[1][1]):
+            print('%-14s %8d %10.4f' % (name, total[0], total[1]))
+        if (self.commands):
+            print('Maya commands: '+', '.join('%s %d' % (name, count) for name, count in self.commands.most_common()))
+            
+profiler = Profiler(os.environ.get('LIGHTNING_PROFILE')) #the only instance of the Profiler class, which is on from the start if the LIGHTNING_PROFILE environment variable is set
+
+class MeshBuilder: #this class collects the tubes of the segments in flat arrays, so that they can be created as a few meshes with one call each
+    def __init__(self, sides=12):
+        ''' Initialises the objects attributes
+        
+        sides             : the number of sides of every tube
+        On exit           : the attributes have been set
+        '''
+        self.sides = sides
+        self.meshes = {} #every mesh is a list of [points, polygon counts, polygon connects] stored as typed arrays like the SegmentStore, where the points are x, y, z one after the other
+        self.curves = {} #every group of curves is a list of curves, each one a list of x, y, z points
+        
+    def addTube(self, key, p1, p2, radius):
+        ''' Adds the vertices and faces of a tube going from p1 to p2 to one of the meshes
+        
+        key               : the mesh the tube is added to, the frame at which the segment becomes visible
+        p1                : the start of the tube
+        p2                : the end of the tube
+        radius            : the radius of the tube
+        On exit           : the vertices and faces have been added to the arrays of the mesh
+        '''
+        self.addChain(key, [p1, p2], [radius, radius], self.sides)
+        
+    def addChain(self, key, path, radii, sides):
+        ''' Adds the vertices and faces of a continuous tube going through several points to one of the meshes. A chain of segments 
+            shares the rings of vertices at its joints and is only closed at its two ends
+        
+        key               : the mesh the tube is added to
+        path              : the points the tube goes through
+        radii             : the radius of the tube at every point
+        sides             : the number of sides of the tube
+        On exit           : the vertices and faces have been added to the arrays of the mesh
+        '''
+        mesh = self.meshes.get(key)
+        if (mesh is None):
+            mesh = self.meshes[key] = [array.array('d'), array.array('i'), array.array('i')]
+        points, counts, connects = mesh
+        axes = []
+        for i in range(len(path)-1): #the axis of every part of the tube
+            ux, uy, uz = path[i+1].x-path[i].x, path[i+1].y-path[i].y, path[i+1].z-path[i].z
+            length = math.sqrt(ux*ux + uy*uy + uz*uz)
+            axes.append((ux/length, uy/length, uz/length))
+        ringAxes = [axes[0]] #the rings at the joints are perpendicular to the average of the two parts they join
+        for i in range(1, len(axes)):
+            ux, uy, uz = axes[i-1][0]+axes[i][0], axes[i-1][1]+axes[i][1], axes[i-1][2]+axes[i][2]
+            length = math.sqrt(ux*ux + uy*uy + uz*uz)
+            ringAxes.append((ux/length, uy/length, uz/length) if length > 1e-9 else axes[i]) #Error checking: a joint that turns back uses the axis of the next part
+        ringAxes.append(axes[-1])
+        
+        first = len(points)//3
+        for i in range(len(path)): #a ring of vertices at every point of the tube
+            ux, uy, uz = ringAxes[i]
+            if (i == 0): #the sides of the tube are found from two vectors perpendicular to the axis, using a helper vector that is not parallel to it
+                if (abs(uy) < 0.9): 
+                    hx, hy, hz = 0.0, 1.0, 0.0
+                else:
+                    hx, hy, hz = 1.0, 0.0, 0.0
+                vx, vy, vz = uy*hz-uz*hy, uz*hx-ux*hz, ux*hy-uy*hx
+            elif (ringAxes[i] != ringAxes[i-1]): #the next rings carry the previous side vector over, so that the tube doesn't twist
+                dot = vx*ux + vy*uy + vz*uz
+                vx, vy, vz = vx-dot*ux, vy-dot*uy, vz-dot*uz
+            if (i == 0 or ringAxes[i] != ringAxes[i-1]):
+                vLength = math.sqrt(vx*vx + vy*vy + vz*vz)
+                vx, vy, vz = vx/vLength, vy/vLength, vz/vLength
+                wx, wy, wz = uy*vz-uz*vy, uz*vx-ux*vz, ux*vy-uy*vx
+            p = path[i]
+            for k in range(sides):
+                angle = 2*math.pi*k/sides
+                c = math.cos(angle)*radii[i]
+                s = math.sin(angle)*radii[i]
+                points.extend((p.x + c*vx + s*wx, p.y + c*vy + s*wy, p.z + c*vz + s*wz))
+        n = sides
+        counts.extend(array.array('i', [4])*(n*(len(path)-1)))
+        for i in range(len(path)-1): #the sides of the tube are quads between every two rings
+            ring = first+i*n
+            for k in range(n):
+                connects.extend((ring+k, ring+(k+1)%n, ring+n+(k+1)%n, ring+n+k))
+        last = first+(len(path)-1)*n
+        counts.extend((n, n)) #the two ends of the tube are closed with a polygon each
+        connects.extend([first+k for k in range(n-1, -1, -1)])
+        connects.extend([last+k for k in range(n)])
+        
+    def addCurve(self, key, path):
+        ''' Adds a linear curve going through several points, used instead of a tube for the thinnest segments
+        
+        key               : the group of curves the curve is added to
+        path              : the points of the curve
+        On exit           : the curve has been stored
+        '''
+        self.curves.setdefault(key, []).append([(p.x, p.y, p.z) for p in path])
+        
+    def emit(self, backend, prefix='segments_'):
+        ''' Creates the meshes with a single call each, instead of one polyCylinder for every segment
+        
+        backend           : the backend that builds the scene, MayaBackend or RecordingBackend
+        prefix            : the start of the name of every mesh, which is followed by its key
+        return            : returns a dictionary with the name of the mesh created for every key
+        '''
+        names = {}
+        for key in sorted(self.meshes):
+            points, counts, connects = self.meshes[key]
+            names[key] = backend.createMesh(prefix+str(key), points, counts, connects)
+        return names
+        
+    def emitCurves(self, backend, prefix='tips_'):
+        ''' Creates the curves, with one transform for every key
+        
+        backend           : the backend that builds the scene, MayaBackend or RecordingBackend
+        prefix            : the start of the name of every transform, which is followed by its key
+        return            : returns a dictionary with the name of the transform created for every key
+        '''
+        names = {}
+        for key in sorted(self.curves):
+            names[key] = backend.createCurves(prefix+str(key), self.curves[key])
+        return names
+        
+    def writeObj(self, path, prefix='segments_'):
+        ''' Writes the meshes to an OBJ file, so that the geometry can be checked without Maya
+        
+        path              : the path of the OBJ file
+        prefix            : the start of the name of every mesh, which is followed by its key
+        On exit           : the OBJ file has been written
+        '''
+        offset = 1 #the vertices in an OBJ file are counted from 1 across all of the objects
+        with open(path, 'w') as objFile:
+            for key in sorted(self.meshes):
+                points, counts, connects = self.meshes[key]
+                objFile.write('o '+prefix+str(key)+'\n')
+                for i in range(0, len(points), 3):
+                    objFile.write('v %f %f %f\n' % (points[i], points[i+1], points[i+2]))
+                i = 0
+                for count in counts:
+                    objFile.write('f '+' '.join([str(index+offset) for index in connects[i:i+count]])+'\n')
+                    i += count
+                offset += len(points)//3
+                
+class LevelOfDetail: #this class decides how detailed the geometry of the segments is, so that the number of polygons doesn't grow with the number of attractors
+    def __init__(self, maxSides=12, minSides=3, edgeLength=0.0, framesPerMesh=1, tipMode='keep', tipRadius=0.001, polygonBudget=0):
+        ''' Initialises the objects attributes
+        
+        maxSides          : the number of sides of the thickest tubes
+        minSides          : the number of sides of the thinnest tubes
+        edgeLength        : the length of the sides of a tube around its circumference, which decides the number of sides from its radius. With 0 every tube has maxSides sides
+        framesPerMesh     : the number of frames of segments in each mesh. The unbranched chains of segments in the same mesh become a single tube
+        tipMode           : what happens to the segments thinner than tipRadius: 'keep', 'cull' or 'curve' to replace them with curves
+        tipRadius         : the radius of the thinnest segment that is still a tube
+        polygonBudget     : the maximum number of polygons of the bolt, 0 for no maximum. Above it the tubes get fewer sides first, then the last frames of the growth are culled
+        On exit           : the attributes have been set
+        '''
+        self.maxSides = maxSides
+        self.minSides = min(minSides, maxSides)
+        self.edgeLength = edgeLength
+        self.framesPerMesh = max(1, framesPerMesh)
+        self.tipMode = tipMode
+        self.tipRadius = tipRadius
+        self.polygonBudget = polygonBudget
+        
+    def settings(self):
+        ''' Returns the attributes as a dictionary, so that they can be stored with the settings of the lightning
+        '''
+        return {'maxSides': self.maxSides, 'minSides': self.minSides, 'edgeLength': self.edgeLength, 'framesPerMesh': self.framesPerMesh, 
+                'tipMode': self.tipMode, 'tipRadius': self.tipRadius, 'polygonBudget': self.polygonBudget}
+                
+    def isFixed(self):
+        ''' Returns True if the polygons of the bolt don't depend on the radius of the segments, so that a change of thickness only moves the vertices
+        '''
+        return self.edgeLength <= 0 and self.tipMode == 'keep' and self.polygonBudget <= 0
+        
+    def sides(self, radius, scale, maxSides):
+        ''' Returns the number of sides of a tube
+        
+        radius            : the radius of the tube
+        scale             : the scale of the lightning, so that the number of sides depends on the radius in the scene
+        maxSides          : the number of sides of the thickest tubes
+        '''
+        if (self.edgeLength <= 0):
+            return maxSides
+        return max(self.minSides, min(maxSides, int(math.ceil(2*math.pi*radius*scale/self.edgeLength))))
+        
+    def bucket(self, frame):
+        ''' Returns the mesh of a segment: the first frame of its group of framesPerMesh frames
+        '''
+        return ((frame-1)//self.framesPerMesh)*self.framesPerMesh + 1
+        
+    def plan(self, topology, radii, scale, maxSides, lastFrame):
+        ''' Walks the tree of the segments and splits it into chains: the segments that are the only child of their father, in the same mesh and with the same number of sides, 
+            continue the chain of their father
+        
+        topology          : the Topology of the bolt
+        radii             : the radius of every segment
+        scale             : the scale of the lightning
+        maxSides          : the number of sides of the thickest tubes
+        lastFrame         : the segments after this frame are culled
+        return            : returns the list of chains, as [mesh, segments, sides, 'tube' or 'curve'], and their number of polygons
+        '''
+        parents = topology.parents
+        frames = topology.frames
+        children = [0]*len(parents)
+        for father in parents:
+            if (father >= 0):
+                children[father] += 1
+        chains = []
+        chainOf = [None]*len(parents) #the chain that every segment belongs to
+        polygons = 0
+        for i in range(len(parents)): #the segments are stored after their father, so the chain of the father already exists
+            father = parents[i]
+            if (father < 0): #the origin segment is not shown
+                continue
+            if (frames[i] > lastFrame): #the frames over the polygon budget are culled whatever the tipMode, otherwise they would still be shown as curves
+                continue
+            kind = 'tube'
+            if (self.tipMode != 'keep' and radii[i]*scale < self.tipRadius):
+                if (self.tipMode != 'curve'):
+                    continue
+                kind = 'curve'
+            sides = 0 if kind == 'curve' else self.sides(radii[i], scale, maxSides)
+            bucket = self.bucket(frames[i])
+            chain = chainOf[father]
+            if (chain is not None and children[father] == 1 and chains[chain][0] == bucket and chains[chain][2] == sides and chains[chain][3] == kind):
+                chains[chain][1].append(i)
             else:
-                brightnessValue = 75/brightnessDivider #brightnessDivider comes from the GUI: it can be used to increase and decrease the brightness
-                percentage = brightnessValue/100
-                glowSubtract = (colour[0]*percentage, colour[1]*percentage, colour[2]*percentage)
-                glowColour = (colour[0]-glowSubtract[0], colour[1]-glowSubtract[1], colour[2]-glowSubtract[2])  #these operations calculate the glow by making the colour of the segments lighter
-                if (brFalloff == False): #the brightness decrease can also be turned off by the user: brFalloff comes from the GUI
-                    brightnessChange=0
-                '''Source: reference from Xiaosong Yangs L-system code'''
-                cmds.setAttr(shaderName+'.outGlowColor', glowColour[0]-brightnessChange, glowColour[1]-brightnessChange, glowColour[2]-brightnessChange, type='double3') #sets the glow attribute
-                cmds.surfaceShaderList(shaderName, add=setName) #add to the list of surface shaders
-                cmds.sets('segment_'+(str(cylinderNumber)), edit=True, forceElement=setName) #assign the material to the object
-                '''End of referenced code'''
+                chain = len(chains)
+                chains.append([bucket, [i], sides, kind])
+                if (kind == 'tube'):
+                    polygons += 2 #the two ends of every tube
+            chainOf[i] = chain
+            polygons += sides
+        return chains, polygons
+        
+    def build(self, topology, radii, scale=1.0):
+        ''' Builds the tubes and curves of the segments, within the polygon budget
+        
+        topology          : the Topology of the bolt
+        radii             : the radius of every segment
+        scale             : the scale of the lightning
+        return            : returns the MeshBuilder with the geometry of every mesh
+        '''
+        lastFrame = max(topology.frames) if topology.frames else 0
+        maxSides = self.maxSides
+        chains, polygons = self.plan(topology, radii, scale, maxSides, lastFrame)
+        if (self.polygonBudget > 0):
+            while (polygons > self.polygonBudget and maxSides > self.minSides): #the tubes get fewer sides first
+                maxSides -= 1
+                chains, polygons = self.plan(topology, radii, scale, maxSides, lastFrame)
+            if (polygons > self.polygonBudget): #then the segments of the last frames are culled: they are the tips of the bolt, as every segment grows after its father
+                low = 0
+                high = lastFrame
+                while (low < high): #the last frame that fits in the budget is found with a binary search
+                    middle = (low+high+1)//2
+                    if (self.plan(topology, radii, scale, maxSides, middle)[1] <= self.polygonBudget):
+                        low = middle
+                    else:
+                        high = middle-1
+                chains, polygons = self.plan(topology, radii, scale, maxSides, low)
+                
+        builder = MeshBuilder(maxSides)
+        for bucket, segments, sides, kind in chains:
+            path = [topology.position(topology.parents[segments[0]])] + [topology.position(i) for i in segments] #the chain starts from the father of its first segment
+            if (kind == 'curve'):
+                builder.addCurve(bucket, path)
+            else:
+                builder.addChain(bucket, path, [radii[segments[0]]] + [radii[i] for i in segments], sides)
+        return builder
+        
+class ShaderPool: #this class keeps the shaders of the lightning, so that the segments with a similar falloff share the same shader
+    def __init__(self, materialType='surfaceShader'):
+        ''' Initialises the objects attributes
+        
+        materialType      : the type of shader used
+        On exit           : the attributes have been set
+        '''
+        self.materialType = materialType
+        self.shadingGroups = {} #the shading group of every combination of colour, brightness, falloffs and falloff step, with the id of its node. It is kept between Apply calls
+        self.members = {} #the meshes assigned to the shading group with every id, as the same shading group can be shared by the lightning and the bolts of a storm
+        
+    def falloffStep(self, iter, steps):
+        ''' Quantizes the falloff of a frame: the colour and glow decrease by iter*0.003, which is rounded down to one of the steps between 0 and 1
+        
+        iter              : the frame of the segments
+        steps             : the number of shaders the falloff is divided into, from the GUI
+        return            : returns the step of the falloff
+        '''
+        return min(steps-1, int(iter*0.003*steps))
+        
+    def getShadingGroup(self, backend, step, steps, colour, brightnessDivider, brFalloff, colFalloff):
+        ''' Returns the shading group of a falloff step, creating the shader only if it doesn't exist yet
+        
+        backend           : the backend that builds the scene, MayaBackend or RecordingBackend
+        step              : the step of the falloff
+        steps             : the number of shaders the falloff is divided into, from the GUI
+        colour            : the colour decided by the user, from the GUI
+        brightnessDivider : the brightness value, from the GUI
+        brFalloff         : boolean that decides if the brightness decreases as the lightning grows, from the GUI
+        colFalloff        : boolean that decides if the colour value decreases as the lightning grows, from the GUI
+        return            : returns the name of the shading group
+        '''
+        key = (self.materialType, tuple(colour), brightnessDivider, brFalloff, colFalloff, step, steps)
+        if (key in self.shadingGroups and self.isValid(backend, *self.shadingGroups[key])):
+            return self.shadingGroups[key][0]
+        
+        outColour, outGlowColour = self.shaderColours(step, steps, colour, brightnessDivider, brFalloff, colFalloff)
+        setName = backend.createShader(self.materialType, outColour, outGlowColour)
+        self.shadingGroups[key] = (setName, backend.nodeId(setName))
+        return setName
+        
+    def isValid(self, backend, setName, nodeId):
+        ''' Returns True if a shading group of the pool is still the node that was created. Error checking: the shader could have been deleted since it was created, 
+            and after a new scene is opened Maya gives the same names to other nodes, so the id of the node is compared instead of its name
+        '''
+        return nodeId is not None and backend.nodeId(setName) == nodeId
+        
+    def shaderColours(self, step, steps, colour, brightnessDivider, brFalloff, colFalloff):
+        ''' Calculates the colour and glow of the shader of a falloff step
+        
+        step              : the step of the falloff
+        steps             : the number of shaders the falloff is divided into, from the GUI
+        colour            : the colour decided by the user, from the GUI
+        brightnessDivider : the brightness value, from the GUI
+        brFalloff         : boolean that decides if the brightness decreases as the lightning grows, from the GUI
+        colFalloff        : boolean that decides if the colour value decreases as the lightning grows, from the GUI
+        return            : returns the colour and the glow colour, which is None if the glow attribute shouldn't be set
+        '''
+        colourChange = float(step)/steps #similarly to the radius, the colour and glow values decrease as the lightning grows
+        brightnessChange = colourChange
+        if (colFalloff == False): #the colour decrease can also be turned off by the user: colFalloff comes from the GUI 
+            colourChange=0
+        outColour = (colour[0]-colourChange, colour[1]-colourChange, colour[2]-colourChange)
+        outGlowColour = None
+        if (brightnessDivider != 0.0): #if the brightness from the GUI is zero, then don't set the glow attribute
+            brightnessValue = 75/brightnessDivider #brightnessDivider comes from the GUI: it can be used to increase and decrease the brightness
+            percentage = brightnessValue/100
+            glowSubtract = (colour[0]*percentage, colour[1]*percentage, colour[2]*percentage)
+            glowColour = (colour[0]-glowSubtract[0], colour[1]-glowSubtract[1], colour[2]-glowSubtract[2])  #these operations calculate the glow by making the colour of the segments lighter
+            if (brFalloff == False): #the brightness decrease can also be turned off by the user: brFalloff comes from the GUI
+                brightnessChange=0
+            outGlowColour = (glowColour[0]-brightnessChange, glowColour[1]-brightnessChange, glowColour[2]-brightnessChange)
+        return outColour, outGlowColour
+        
+    def assign(self, backend, meshNames, steps, colour, brightnessDivider, brFalloff, colFalloff):
+        ''' Sets the colour and glow of the meshes of every frame, assigning all of the meshes that share a shader with a single call
+        
+        backend           : the backend that builds the scene, MayaBackend or RecordingBackend
+        meshNames         : a dictionary with the mesh of every frame
+        steps             : the number of shaders the falloff is divided into, from the GUI
+        colour            : the colour decided by the user, from the GUI
+        brightnessDivider : the brightness value, from the GUI
+        brFalloff         : boolean that decides if the brightness decreases as the lightning grows, from the GUI
+        colFalloff        : boolean that decides if the colour value decreases as the lightning grows, from the GUI
+        On exit           : every mesh has been assigned to a shared shading group
+        '''
+        members = {} #the meshes of every falloff step
+        for frame in sorted(meshNames):
+            step = self.falloffStep(frame, steps)
+            if (colFalloff == False and brFalloff == False): #without any falloff every segment has the same shader
+                step = 0
+            members.setdefault(step, []).append(meshNames[frame])
+        assigned = set(meshNames.values())
+        for setName in self.members: #a mesh can only be in one shading group, so the meshes are removed from the ones they were in
+            self.members[setName] -= assigned
+        for step in sorted(members):
+            setName = self.getShadingGroup(backend, step, steps, colour, brightnessDivider, brFalloff, colFalloff)
+            backend.assignShader(members[step], setName)
+            self.members.setdefault(backend.nodeId(setName), set()).update(members[step])
+            
+    def recolour(self, backend, steps, oldLook, newLook, meshNames):
+        ''' Changes the colour and glow of the shaders that are already in the scene, instead of creating new ones.
+            Used when the lightning is updated and the falloff steps of its meshes stay the same. A shader that is also 
+            assigned to other meshes, like the bolts of a storm with the same look, is left as it is
+        
+        backend           : the backend that builds the scene, MayaBackend or RecordingBackend
+        steps             : the number of shaders the falloff is divided into, from the GUI
+        oldLook           : the colour, brightness, brightness falloff and colour falloff the shaders were created with
+        newLook           : the new colour, brightness, brightness falloff and colour falloff, from the GUI
+        meshNames         : the names of the meshes that are updated
+        On exit           : the shaders used only by these meshes have been edited and are stored under their new key
+        '''
+        meshNames = set(meshNames)
+        oldLook = (tuple(oldLook[0]),) + tuple(oldLook[1:])
+        newLook = (tuple(newLook[0]),) + tuple(newLook[1:])
+        for key in list(self.shadingGroups):
+            if (key[0] != self.materialType or key[1:5] != oldLook or key[6] != steps):
+                continue
+            setName, nodeId = self.shadingGroups[key]
+            if (self.isValid(backend, setName, nodeId) == False): #the node is not the one of the pool, so it is not edited
+                del self.shadingGroups[key]
+                continue
+            others = [name for name in self.members.get(nodeId, ()) if name not in meshNames and backend.exists(name)] #the meshes that were deleted don't use the shader anymore
+            if (others): #the shader is shared, so the meshes that are updated get new shaders when they are assigned
+                continue
+            del self.shadingGroups[key]
+            outColour, outGlowColour = self.shaderColours(key[5], steps, *newLook)
+            backend.setShaderColour(setName, outColour, outGlowColour)
+            self.shadingGroups[(self.materialType,) + newLook + (key[5], steps)] = (setName, nodeId)
+            
+shaderPool = ShaderPool() #the only instance of the ShaderPool class, so that the shaders are reused every time the lightning is created
+        
+class AnimationStage: #this class collects the visibility keys of the segments during the growth and writes them in bulk, one animation curve for every mesh
+    def __init__(self):
+        ''' Initialises the objects attributes
+        
+        On exit           : the attributes have been set
+        '''
+        self.keys = {} #the keys of every mesh, as a dictionary of the value at every time. The segments of the same mesh share their keys
+        
+    def addKey(self, key, keyTime, value):
+        ''' Adds a visibility key to one of the meshes
+        
+        key               : the mesh the key is added to, the frame at which its segments become visible
+        keyTime           : the time of the key
+        value             : the visibility at that time
+        On exit           : the key has been stored
+        '''
+        self.keys.setdefault(key, {})[keyTime] = value
+        
+    def write(self, backend, meshNames):
+        ''' Writes the keys of every mesh with a single call, instead of calling setKeyframe for every key of every segment
+        
+        backend           : the backend that builds the scene, MayaBackend or RecordingBackend
+        meshNames         : a dictionary with the name of the mesh created for every key
+        On exit           : the visibility of every mesh is animated
+        '''
+        for key in sorted(self.keys):
+            if (key not in meshNames): #Error checking: keys without a mesh are ignored
+                continue
+            times = sorted(self.keys[key])
+            backend.keyVisibility(meshNames[key], times, [self.keys[key][keyTime] for keyTime in times])
+            
+class MayaBackend: #this class builds the lightning in the Maya scene. Every other class only calls these methods, so that the growth doesn't depend on Maya
+    def createMesh(self, name, points, counts, connects):
+        ''' Creates a mesh with all of its vertices and faces at once, using MFnMesh.create
+        
+        name              : the name of the mesh
+        points            : the vertices of the mesh, as x, y, z one after the other
+        counts            : the number of vertices of every face
+        connects          : the vertices of every face, one face after the other
+        return            : returns the name of the mesh, which Maya could have changed
+        '''
+        vertices = [om2.MPoint(points[i], points[i+1], points[i+2]) for i in range(0, len(points), 3)]
+        transform = om2.MFnMesh().create(vertices, counts, connects)
+        return om2.MFnDependencyNode(transform).setName(name)
+        
+    def createCurves(self, name, curves):
+        ''' Creates linear curves under a single transform, using MFnNurbsCurve.create
+        
+        name              : the name of the transform
+        curves            : the points of every curve, as a list of x, y, z
+        return            : returns the name of the transform, which Maya could have changed
+        '''
+        transform = om2.MFnDagNode().create('transform')
+        for curve in curves:
+            points = om2.MPointArray([om2.MPoint(x, y, z) for x, y, z in curve])
+            om2.MFnNurbsCurve().create(points, list(range(len(curve))), 1, om2.MFnNurbsCurve.kOpen, False, False, transform) #a linear curve has one knot for every point
+        return om2.MFnDependencyNode(transform).setName(name)
+        
+    def createShader(self, materialType, colour, glowColour):
+        ''' Creates a shader and its shading group
+        
+        materialType      : the type of shader used
+        colour            : the outColor of the shader
+        glowColour        : the outGlowColor of the shader, or None to not set the glow attribute
+        return            : returns the name of the shading group
+        '''
+        setName = cmds.sets(name='_MaterialGroup_', renderable=True, empty=True) #creates a new shading node
+        shaderName = cmds.shadingNode(materialType, asShader=True)
+        cmds.setAttr(shaderName+'.outColor', colour[0], colour[1], colour[2], type='double3') #changes the colour
+        '''Source: reference from Xiaosong Yangs L-system code'''
+        if (glowColour is not None):
+            cmds.setAttr(shaderName+'.outGlowColor', glowColour[0], glowColour[1], glowColour[2], type='double3') #sets the glow attribute
+        cmds.surfaceShaderList(shaderName, add=setName) #add to the list of surface shaders
+        '''End of referenced code'''
+        return setName
+        
+    def assignShader(self, meshNames, setName):
+        ''' Assigns a list of meshes to a shading group with a single call
+        '''
+        cmds.sets(meshNames, edit=True, forceElement=setName) #assign the material to the objects
+        
+    def keyVisibility(self, meshName, times, values):
+        ''' Creates one animation curve for the visibility of a mesh and adds all of its keys with a single call
+        
+        meshName          : the name of the mesh
+        times             : the time of every key
+        values            : the visibility of every key
+        On exit           : the visibility of the mesh is animated
+        '''
+        timeArray = om2.MTimeArray()
+        for keyTime in times:
+            timeArray.append(om2.MTime(keyTime, om2.MTime.uiUnit()))
+        plug = om2.MSelectionList().add(meshName+'.visibility').getPlug(0)
+        if (plug.isDestination): #when the lightning is updated the old keys are removed, so that they can be retimed
+            cmds.cutKey(meshName, attribute='visibility', clear=True)
+        curve = oma2.MFnAnimCurve()
+        curve.create(plug, oma2.MFnAnimCurve.kAnimCurveTU) #the same type of curve that setKeyframe creates for the visibility
+        curve.addKeys(timeArray, values, oma2.MFnAnimCurve.kTangentStep, oma2.MFnAnimCurve.kTangentStep) #visibility keys are stepped
+        
+    def setMeshPoints(self, meshName, points):
+        ''' Moves the vertices of an existing mesh, keeping its polygons
+        
+        meshName          : the name of the mesh
+        points            : the flat list of the new x, y, z coordinates of the vertices
+        On exit           : the vertices of the mesh have been moved
+        '''
+        pointArray = om2.MPointArray()
+        for i in range(0, len(points), 3):
+            pointArray.append(om2.MPoint(points[i], points[i+1], points[i+2]))
+        dagPath = om2.MSelectionList().add(meshName).getDagPath(0)
+        om2.MFnMesh(dagPath).setPoints(pointArray)
+        
+    def setShaderColour(self, setName, colour, glowColour):
+        ''' Changes the colour and glow of the shader of a shading group
+        
+        setName           : the name of the shading group
+        colour            : the colour of the shader
+        glowColour        : the glow colour of the shader, None if it shouldn't glow
+        On exit           : the attributes of the shader have been set
+        '''
+        shaderName = cmds.listConnections(setName+'.surfaceShader', source=True, destination=False)[0]
+        cmds.setAttr(shaderName+'.outColor', colour[0], colour[1], colour[2], type='double3')
+        if (glowColour is None): #a shader that was created with glow has to lose it
+            glowColour = (0, 0, 0)
+        cmds.setAttr(shaderName+'.outGlowColor', glowColour[0], glowColour[1], glowColour[2], type='double3')
+        
+    def setSettings(self, groupName, text):
+        ''' Stores the settings the lightning was created with in a string attribute of its group
+        '''
+        if (cmds.attributeQuery('lightningSettings', node=groupName, exists=True) == False):
+            cmds.addAttr(groupName, longName='lightningSettings', dataType='string')
+        cmds.setAttr(groupName+'.lightningSettings', text, type='string')
+        
+    def getSettings(self, groupName):
+        ''' Returns the settings stored by setSettings, None if the group or the attribute don't exist
+        '''
+        if (cmds.objExists(groupName) == False or cmds.attributeQuery('lightningSettings', node=groupName, exists=True) == False):
+            return None
+        return cmds.getAttr(groupName+'.lightningSettings')
+        
+    def exists(self, name):
+        return cmds.objExists(name)
+        
+    def nodeId(self, name):
+        ''' Returns the UUID of a node, which unlike its name is never given to another node, or None if the node doesn't exist
+        '''
+        if (cmds.objExists(name) == False):
+            return None
+        return cmds.ls(name, uuid=True)[0]
+        
+    def delete(self, name):
+        cmds.delete(name)
+        
+    def group(self, names, groupName):
+        ''' Groups the meshes of the lightning
+        
+        return            : returns the name of the group
+        '''
+        return cmds.group(names, name=groupName) #Error checking: only the meshes of the lightning are given to the group, so that no other objects in the scene are added to it
+        
+    def transformGroup(self, groupName, rotation, size, pivot, offset=(0, 0, 0)):
+        ''' Rotates around the z axis and scales a group around a pivot, then moves it by an offset
+        '''
+        cmds.xform(groupName, translation=(0, 0, 0), rotation=(0, 0, 0), scale=(1, 1, 1)) #the transformation starts from scratch, so that an update doesn't add up with the previous one
+        cmds.select(groupName)
+        cmds.rotate(0, 0, -rotation, p=pivot)
+        cmds.scale(size, size, size, p=pivot) 
+        if (offset != (0, 0, 0)): #the bolts of a storm are spread around the origin
+            cmds.move(offset[0], offset[1], offset[2], relative=True)
+        cmds.select(deselect=True)
+        
+    def playback(self, endFrame, play):
+        ''' Sets the length of the animation and plays it
+        
+        endFrame          : the last frame of the animation
+        play              : boolean that decides if the animation should keep playing
+        '''
+        cmds.playbackOptions(minTime=0, maxTime=endFrame)
+        cmds.play()
+        if (play == False): #if the 'Play animation' checkbox in the GUI is not checked, don't play the animation on creation
+            cmds.play(state=False)
+            
+class RecordingBackend: #this class is a stand-in for MayaBackend: it builds nothing, but counts and logs the calls that would be made to Maya
+    nodeIds = itertools.count(1) #the ids of the nodes, shared by the backends so that two of them behave like two scenes opened in the same session
+    
+    def __init__(self, log=False):
+        ''' Initialises the objects attributes
+        
+        log               : boolean that decides if every call is stored in the log list, with a short description of its arguments
+        On exit           : the attributes have been set
+        '''
+        self.calls = collections.Counter() #the number of calls of every method
+        self.log = [] if log else None
+        self.names = set() #the names of the nodes that would exist in the scene
+        self.polygons = 0
+        self.vertices = 0
+        self.settings = {} #the settings stored in every group
+        self.children = {} #the nodes of every group, which are deleted with it
+        self.ids = {} #the id of every node, unique across all of the backends like the UUIDs of Maya
+        
+    def record(self, method, *args):
+        ''' Counts a call and adds it to the log. While the profiler is on the call is also counted as a command, as there is no maya.cmds to count outside of Maya
+        '''
+        self.calls[method] += 1
+        if (profiler.enabled):
+            profiler.commands[method] += 1
+        if (self.log is not None):
+            self.log.append((method,) + args)
+            
+    def createNode(self, name):
+        ''' Returns a unique name for a new node, the way Maya renames the nodes with the same name
+        '''
+        newName = name
+        i = 1
+        while (newName in self.names):
+            newName = name+str(i)
+            i += 1
+        self.names.add(newName)
+        self.ids[newName] = next(RecordingBackend.nodeIds)
+        return newName
+        
+    def createMesh(self, name, points, counts, connects):
+        self.record('createMesh', name, len(points)//3, len(counts))
+        self.vertices += len(points)//3
+        self.polygons += len(counts)
+        return self.createNode(name)
+        
+    def createCurves(self, name, curves):
+        self.record('createCurves', name, len(curves))
+        return self.createNode(name)
+        
+    def createShader(self, materialType, colour, glowColour):
+        self.record('createShader', materialType, tuple(colour), glowColour)
+        return self.createNode('_MaterialGroup_')
+        
+    def assignShader(self, meshNames, setName):
+        self.record('assignShader', len(meshNames), setName)
+        
+    def keyVisibility(self, meshName, times, values):
+        self.record('keyVisibility', meshName, len(times))
+        
+    def setMeshPoints(self, meshName, points):
+        self.record('setMeshPoints', meshName, len(points)//3)
+        
+    def setShaderColour(self, setName, colour, glowColour):
+        self.record('setShaderColour', setName, tuple(colour), glowColour)
+        
+    def setSettings(self, groupName, text):
+        self.record('setSettings', groupName)
+        self.settings[groupName] = text
+        
+    def getSettings(self, groupName):
+        self.record('getSettings', groupName)
+        if (groupName not in self.names):
+            return None
+        return self.settings.get(groupName)
+        
+    def exists(self, name):
+        self.record('exists', name)
+        return name in self.names
+        
+    def nodeId(self, name):
+        self.record('nodeId', name)
+        return self.ids[name] if name in self.names else None
+        
+    def delete(self, name):
+        self.record('delete', name)
+        nodes = [name]
+        while (nodes):
+            node = nodes.pop()
+            self.names.discard(node)
+            self.settings.pop(node, None)
+            nodes.extend(self.children.pop(node, []))
+        
+    def group(self, names, groupName):
+        self.record('group', len(names), groupName)
+        groupName = self.createNode(groupName)
+        self.children[groupName] = list(names)
+        return groupName
+        
+    def transformGroup(self, groupName, rotation, size, pivot, offset=(0, 0, 0)):
+        self.record('transformGroup', groupName, rotation, size, tuple(offset))
+        
+    def playback(self, endFrame, play):
+        self.record('playback', endFrame, play)
+                          
+class SegmentGrid: #this class is a spatial index of the segments created in one iteration, used by the 'grid' and 'frontier' growth engines
+    def __init__(self, cellSize):
+        ''' Initialises the objects attributes
+        
+        cellSize          : the size of each cubic cell of the grid
+        On exit           : the attributes have been set
+        '''
+        self.cellSize = cellSize
+        self.cells = {} #every cell is a list of the lowest and highest x, y, z of the segments inside of it, followed by the list of (index, x, y, z) of those segments. Only the cells containing segments exist
+        
+    def insert(self, index, x, y, z):
+        ''' Adds a segment to its cell, and grows the box of the cell so that it contains the segment
+        
+        index             : the index of the segment in the segment store
+        x, y, z           : the position of the segment
+        On exit           : the segment has been added to its cell
+        '''
+        key = (int(math.floor(x/self.cellSize)), int(math.floor(y/self.cellSize)), int(math.floor(z/self.cellSize)))
+        cell = self.cells.get(key)
+        if (cell is None):
+            self.cells[key] = [x, y, z, x, y, z, [(index, x, y, z)]]
+            return
+        cell[0] = min(cell[0], x)
+        cell[1] = min(cell[1], y)
+        cell[2] = min(cell[2], z)
+        cell[3] = max(cell[3], x)
+        cell[4] = max(cell[4], y)
+        cell[5] = max(cell[5], z)
+        cell[6].append((index, x, y, z))
+            
+    def closest(self, pos, closestIndex, record, nearest, minDist, maxDist):
+        ''' Finds the closest segment to a position, starting from the closest segment found in the previous iterations. The cells whose box 
+            is further than that segment, or than maxDist, are skipped without measuring their segments
+        
+        pos               : the position of the attractor
+        closestIndex      : the index of the closest segment found in the previous iterations, or None
+        record            : the distance of that segment
+        nearest           : the distance of the nearest segment at any distance found in the previous iterations, or None if it isn't needed. The cells closer than it are measured too
+        minDist           : if a segment is closer than this distance the attractor is reached
+        maxDist           : the segments further than this distance are ignored
+        return            : returns the index of the closest segment or None, its distance, the distance of the nearest segment and whether the attractor has been reached
+        '''
+        px, py, pz = pos.x, pos.y, pos.z
+        for loX, loY, loZ, hiX, hiY, hiZ, segments in self.cells.values():
+            gx = loX-px if px < loX else (px-hiX if px > hiX else 0.0) #the distance of the box is never bigger than the distance of the segments inside of it, even with rounding
+            gy = loY-py if py < loY else (py-hiY if py > hiY else 0.0)
+            gz = loZ-pz if pz < loZ else (pz-hiZ if pz > hiZ else 0.0)
+            limit = maxDist if closestIndex is None else record
+            if (nearest is not None and nearest > limit):
+                limit = nearest
+            if (math.sqrt(gx*gx + gy*gy + gz*gz) > limit):
+                continue
+            for index, x, y, z in segments:
+                dx = px-x
+                dy = py-y
+                dz = pz-z
+                d = math.sqrt(dx*dx + dy*dy + dz*dz) #the same as stepMVector, so that the distances are exactly the same
+                if (d < minDist):
+                    return None, record, nearest, True
+                if (nearest is not None and d < nearest):
+                    nearest = d
+                if (d <= maxDist and (closestIndex is None or d < record or (d == record and index < closestIndex))): #equal distances keep the oldest segment, like stepMVector
+                    closestIndex = index
+                    record = d
+        return closestIndex, record, nearest, False
                           
 class Bolt: #this class contains the main methods used to create the lightning
-    def __init__(self, newAttrNumber, newArea, height):
+    def __init__(self, newAttrNumber, newArea, height, engine='mvector', seed=None, maxIterations=1000, timeBudget=None, stallIterations=20):
         ''' Initialises the objects attributes
         
         newAttrNumber    : the number of attractors, from the GUI
         newArea          : the area in which to spawn the attractors, from the GUI
         height           : the y value of the origin, from the GUI
+        engine           : the growth engine, 'mvector' for the original loops, 'numpy' for the vectorised attraction step, 'grid' for the growth that only checks the new segments near 
+                           every attractor, or 'frontier' for the same growth that also retires the stalled attractors, from the GUI
+        seed             : the random seed, from the GUI: the same seed always grows the same bolt. If it is None a different bolt is grown every time
+        maxIterations    : the growth stops after this number of iterations even if some attractors are left, no limit if it is None or 0, from the GUI
+        timeBudget       : the growth stops after this number of seconds even if some attractors are left, no limit if it is None or 0, from the GUI
+        stallIterations  : the 'frontier' engine retires an attractor when no segment got closer to it for this number of iterations
         On exit          : the attractors and origin segment are created and put in their list 
         '''
+        self.attrNumber = newAttrNumber
+        self.area = newArea
+        self.height = height
+        self.maxIterations = maxIterations
+        self.timeBudget = timeBudget
+        self.stallIterations = stallIterations
         self.attrList = []
-        self.segmList = [] #the attractor and segment lists contain all the attractor and segment objects
+        self.segmList = SegmentStore() #the attractor list contains all the attractor objects, and the segment store all of the segments
         self.maxDist = 100
         self.minDist = 5 #these distances reppresent the area of influence of an attractor: the segments in between these distances are attracted to the points
+        if (engine == 'numpy' and np is None): #Error checking: without numpy the original engine is used
+            print("numpy is not available, the 'mvector' growth engine will be used instead")
+            engine = 'mvector'
+        self.engine = engine
+        self.seed = seed
+        self.random = random.Random(seed) #every random value of the bolt comes from its own generator, so that the global random module doesn't change the result
         
         '''This part creates a certain number of attractors, which are instances of the Point class, and adds them in the attractors list. The number of attractors and the area 
            they are created in are decided by the user from the GUI'''        
         for i in range (newAttrNumber):
-            attr = Point(newArea)
+            attr = Point(newArea, self.random)
             self.attrList.append(attr)
       
         '''This part determines the position and direction of the origin segment and adds it to the segments list. The height of the origin is decided by the user from the GUI'''            
-        p = MPoint(0,height+40,0)
-        d = MVector(0,-1,0)
-        origin = Line(p, None, d) #the origin is an instance of the Line class with no father
-        self.segmList.append(origin)
+        p = Vector(0,height+40,0)
+        d = Vector(0,-1,0)
+        self.segmList.add(p, None, d) #the origin is the segment with no father
+
+        '''The numpy engine keeps a copy of the attractor and segment positions in arrays, so that the distances can be calculated all at once'''
+        if (self.engine == 'numpy'):
+            self.attrArray = np.array([(attr.pos.x, attr.pos.y, attr.pos.z) for attr in self.attrList], dtype=float).reshape(-1, 3)
+            self.segmArray = np.array([(p.x, p.y, p.z)], dtype=float)
+            self.chunkSize = 2000000 #the maximum number of attractor-segment distances calculated at once
+        
+        '''The grid and frontier engines remember the closest segment of every attractor, so that only the segments created in the last iteration are measured,
+           and they put those segments in a spatial index, so that every attractor skips the cells further than its closest segment.
+           The attractors are removed by flagging them in the alive list, and the lists are only compacted when most of them are gone'''
+        if (self.engine == 'grid' or self.engine == 'frontier'):
+            self.cellSize = 2*self.minDist #cells twice as big as minDist are about the size of the clusters of new segments at the tips of the branches
+            self.checked = 0 #the number of segments already measured from every attractor
+            self.closest = [None]*newAttrNumber #the index of the closest segment between minDist and maxDist
+            self.record = [0.0]*newAttrNumber #the distance of the closest segment
+            self.nearest = [float('inf')]*newAttrNumber #the distance of the nearest segment at any distance, used by the frontier engine to know if the growth is getting closer
+            self.idle = [0]*newAttrNumber #the number of iterations in which no segment got closer
+            self.alive = [True]*newAttrNumber
+            self.aliveCount = newAttrNumber
+        self.retired = 0 #the number of attractors retired by the frontier engine
                            
-    def grow(self, newThickness, newSize, newRotation, newColour, newBrightness, brFalloff, colFalloff, newSegmFalloff, newAnimationContr):
-        ''' The heart of the program. It loops through the attractors and segments and determines which ones are to be attracted: in other words, the ones between the minimum and maximum distance(the attractors influence)
+    def stepMVector(self):
+        ''' One iteration of the growth using the Vector class: every attractor is compared with every segment
         
-        newThickness     : the initial radius of the lightning segments, from the GUI
-        newSize          : the value for which the lightning should be scaled, from the GUI
-        newRotation      : the value for which the lightning should be rotated, from the GUI
-        newColour        : the colour decided by the user, from the GUI
-        newBrightness    : the brightness value, from the GUI
-        brFalloff        : boolean that decides if the brightness decreases as the lightning grows, from the GUI
-        colFalloff       : boolean that decides if the colour value decreases as the lightning grows, from the GUI
-        newSegmFalloff   : boolean that decides if the radius decreases as the lightning grows, from the GUI
-        newAnimationContr: boolean that decides if the animation should play when the lightning is created, from the GUI 
-        On exit          : once this function has finished looping the lightning is created    
+        On exit          : the reached attractors have been removed and the attracted segments have grown by one segment
         '''
-        iterations = 0
-        while (len(self.attrList) is not 0): #the loop stops only when all of the attractors are reached
-            iterations += 1 #multiple segments can be created for each iteration of the loop: this line keeps track of that value so it can be used later to create the frames of animation  
+        with profiler.phase('attraction'):
+            positions = self.segmList.positions
+            coords = list(zip(range(len(self.segmList)), positions[0::3], positions[1::3], positions[2::3])) #the index and x, y, z of every segment, read from the store once for every iteration
             '''Source: reference from The Coding Train'''
             for i in range(len(self.attrList)): #the code loops through all of the attractors and finds the closest segment, unlike the L-system which works from the segments
                 currentAttr = self.attrList[i]
+                pos = currentAttr.pos
+                px, py, pz = pos.x, pos.y, pos.z
                 closestSegm = None
                 record = 100000
-                for j in range(len(self.segmList)): #to find the closest segment, the code loops through all of the segments and calculates the distance from the current attractor
-                    currentSegm = self.segmList[j]
-                    d = currentAttr.pos.distanceTo(currentSegm.pos)
+                for j, x, y, z in coords: #to find the closest segment, the code loops through all of the segments and calculates the distance from the current attractor
+                    dx = px-x
+                    dy = py-y
+                    dz = pz-z
+                    d = math.sqrt(dx*dx + dy*dy + dz*dz) #the same as Vector.distanceTo
                     if (d < self.minDist): #if the distance is less than minDist the attractor will get flagged as reached
                         currentAttr.reached = True 
                         closestSegm = None
@@ -197,14 +1271,12 @@ class Bolt: #this class contains the main methods used to create the lightning
                     elif (d > self.maxDist): #if the distance is bigger than maxDistance nothing happens
                         something = 1     
                     elif (closestSegm == None or d < record): #record keeps track of which segment is the closest
-                        closestSegm = currentSegm
+                        closestSegm = j
                         record = d
                 if (closestSegm != None): #when the closest segment is found at the end of the inner loop, this section plays out
-                    newDir = (currentAttr.pos - closestSegm.pos) #the new direction is towards the current attractor
-                    newDir.normalize() #the direction gets normalized
-                    closestSegm.dir += newDir 
-                    closestSegm.count = closestSegm.count + 1 #the new direction is added and count increases: it will be used later to average the directions
+                    self.segmList.attract(closestSegm, pos) #the normalized direction towards the current attractor is added and count increases: it will be used later to average the directions
                     '''End of referenced code'''
+        with profiler.phase('pruning'):
             '''This part removes the reached attractors from the attractors list'''
             i = len(self.attrList) - 1 #removing objects from the back of an array is generally safer
             while i >= 0:
@@ -212,78 +1284,786 @@ class Bolt: #this class contains the main methods used to create the lightning
                     attrToRemove = self.attrList[i]
                     self.attrList.remove(attrToRemove)
                 i -= 1
-                
+            
+        with profiler.phase('averaging'):
             '''This part averages the directions of a segment to the attractors, and also adds an extra random 
                factor to make it resemble a bolt more
                Source: reference from The Coding Train'''
+            counts = self.segmList.counts
             i = len(self.segmList) - 1
             while i >= 0:
-                currentSegm = self.segmList[i]
-                if (currentSegm.count > 0): #if the segment has at least one attractor its attracted to, continue with code
-                    currentSegm.dir /= currentSegm.count #one segment can be attracted to several attractors: this line avareges all of the found directions 
-                    rand = MVector(random.uniform(-0.5, 0.5), random.uniform(-0.5, 0.5), random.uniform(-0.5, 0.5))
-                    currentSegm.dir += rand #a random factor is added to make it look more jaggered
-                    currentSegm.dir.normalize()
-                    self.segmList.append(currentSegm.next()) #the next() function is called: the newly calculated segment will become an instance of the Line class and be added to the segment list
-                    currentSegm.resetFunc() #the resetFunc() is called: the direction and count will be reset
+                if (counts[i] > 0): #if the segment has at least one attractor its attracted to, continue with code
+                    rand = (self.random.uniform(-0.5, 0.5), self.random.uniform(-0.5, 0.5), self.random.uniform(-0.5, 0.5))
+                    self.segmList.average(i, rand) #one segment can be attracted to several attractors: the found directions are averaged and a random factor is added to make it look more jaggered
+                    self.segmList.next(i) #the next() function is called: the newly calculated segment is added to the segment store
+                    self.segmList.reset(i) #the reset() function is called: the direction and count will be reset
                 i -= 1
                 '''End of referenced code'''
+
+    def stepNumpy(self):
+        ''' One iteration of the growth using numpy arrays: the distances between every attractor and every segment are calculated at once,
+            but the result is the same as stepMVector for the same random seed
+
+        On exit          : the reached attractors have been removed and the attracted segments have grown by one segment
+        '''
+        with profiler.phase('attraction'):
+            '''This part adds the segments created in the last iteration to the positions array'''
+            if (len(self.segmArray) < len(self.segmList)):
+                newPositions = np.array(self.segmList.positions[3*len(self.segmArray):], dtype=float).reshape(-1, 3)
+                self.segmArray = np.concatenate((self.segmArray, newPositions))
+
+            '''This part finds the closest segment of every attractor. The attractors are processed in chunks so that the distance matrix doesn't get too big'''
+            attrNumber = len(self.attrArray)
+            reached = np.zeros(attrNumber, dtype=bool)
+            closest = np.full(attrNumber, -1, dtype=int)
+            chunk = max(1, self.chunkSize // len(self.segmArray))
+            for start in range(0, attrNumber, chunk):
+                diff = self.attrArray[start:start+chunk, None, :] - self.segmArray[None, :, :]
+                dist = np.sqrt((diff*diff).sum(axis=2)) #the distance of every attractor in the chunk from every segment
+                reached[start:start+chunk] = (dist < self.minDist).any(axis=1) #if any distance is less than minDist the attractor is reached
+                dist[dist > self.maxDist] = np.inf #the segments further than maxDist are ignored
+                nearest = dist.argmin(axis=1) #argmin keeps the first of equal distances, just like the record in stepMVector
+                found = np.isfinite(dist[np.arange(len(dist)), nearest])
+                closest[start:start+chunk] = np.where(found, nearest, -1)
+
+        with profiler.phase('averaging'):
+            '''This part sums the normalized directions towards the attractors and averages them for every attracted segment'''
+            attracted = np.flatnonzero(~reached & (closest >= 0))
+            if (len(attracted) > 0):
+                segmIndex = closest[attracted]
+                newDir = self.attrArray[attracted] - self.segmArray[segmIndex]
+                newDir /= np.sqrt((newDir*newDir).sum(axis=1))[:, None] #the directions get normalized
+                grown, inverse = np.unique(segmIndex, return_inverse=True)
+                dirs = self.segmList.dirs
+                summedDir = np.array([(dirs[3*j], dirs[3*j+1], dirs[3*j+2]) for j in grown], dtype=float)
+                np.add.at(summedDir, inverse.ravel(), newDir) #the directions are added one at a time in the attractors order, like in stepMVector
+                count = np.bincount(inverse.ravel(), minlength=len(grown))
+                summedDir /= count[:, None]
+                order = np.arange(len(grown))[::-1] #the random factor is taken in the same order as stepMVector, from the last segment to the first
+                rand = np.array([(self.random.uniform(-0.5, 0.5), self.random.uniform(-0.5, 0.5), self.random.uniform(-0.5, 0.5)) for k in order], dtype=float)
+                summedDir[order] += rand
+                summedDir /= np.sqrt((summedDir*summedDir).sum(axis=1))[:, None]
+                for k in order:
+                    j = int(grown[k])
+                    self.segmList.setDirection(j, float(summedDir[k][0]), float(summedDir[k][1]), float(summedDir[k][2]))
+                    self.segmList.next(j)
+                    self.segmList.reset(j)
+
+        with profiler.phase('pruning'):
+            '''This part removes the reached attractors from the attractors list and array'''
+            if (reached.any()):
+                self.attrArray = self.attrArray[~reached]
+                self.attrList = [attr for attr, r in zip(self.attrList, reached) if not r]
+
+    def stepFrontier(self):
+        ''' One iteration of the growth that only measures the distances from the segments created in the last iteration, as the segments measured in the previous 
+            iterations didn't reach the attractors: the closest segment found in the previous iterations is kept for every attractor. The 'frontier' engine also 
+            retires the stalled attractors. The 'grid' engine and the 'frontier' engine without retired attractors give the same result as stepMVector for the same random seed
+        
+        On exit          : the reached and stalled attractors have been removed and the attracted segments have grown by one segment
+        '''
+        with profiler.phase('attraction'):
+            segmList = self.segmList
+            grid = SegmentGrid(self.cellSize)
+            newPositions = segmList.positions[3*self.checked:]
+            for j, x, y, z in zip(range(self.checked, len(segmList)), newPositions[0::3], newPositions[1::3], newPositions[2::3]): #the segments that grew from the segments attracted in the last iteration
+                grid.insert(j, x, y, z)
+            self.checked = len(segmList)
+            retiring = self.engine == 'frontier'
+            attracted = []
+            for i in range(len(self.attrList)):
+                if (not self.alive[i]):
+                    continue
+                pos = self.attrList[i].pos
+                closestIndex, record, nearest, reached = grid.closest(pos, self.closest[i], self.record[i], self.nearest[i] if retiring else None, self.minDist, self.maxDist)
+                    
+                '''This part removes the reached attractors, and retires the ones that are out of range or stalled between branches'''
+                if (retiring):
+                    if (nearest < self.nearest[i]):
+                        self.idle[i] = 0
+                    else:
+                        self.idle[i] += 1
+                if (reached or (retiring and self.idle[i] >= self.stallIterations)):
+                    self.alive[i] = False
+                    self.aliveCount -= 1
+                    if (not reached):
+                        self.retired += 1
+                    continue
+                self.closest[i] = closestIndex
+                self.record[i] = record
+                if (retiring):
+                    self.nearest[i] = nearest
+                if (closestIndex is not None):
+                    if (segmList.attract(closestIndex, pos) == 1):
+                        attracted.append(closestIndex)
                 
-            '''This loop calls the showMesh function for every segment'''          
-            for i in range (len(self.segmList)):
-                self.segmList[i].showMesh(iterations, i, newThickness, newSegmFalloff) #the showMesh function creates the mesh and the first half of the animation
-        
-        '''This loop calls the setMaterial and unshowMesh for every segment'''        
-        minIterations = iterations+20 #minIterations is the first frame of the second half of the animation
-        for i in range (len(self.segmList)):
-            self.segmList[i].setMaterial(self.segmList[i].frame, i, newColour, newBrightness, brFalloff, colFalloff) #the setMaterial function assigns colour and brightness to the segments
-            endFrame=self.segmList[i].unshowMesh(minIterations, i) #the unshowMesh function creates the second half of the animation, where the lightning disappears
-        
-        '''This part groups all the segments together'''
-        for i in range(len(self.segmList)): 
-            if (self.segmList[i].father is not None):          
-                cmds.select("segment_"+str(i), add=True) #Error checking: this part is coded in a way as to not include other objects in the scene wich should not be added to the group
-        cmds.group(name='Lightning')
-        
-        '''This section rotates and scales the fineshed Lightning mesh based on imput from the GUI'''
-        cmds.select('Lightning')
-        cmds.rotate(0, 0, -newRotation, p=(0,25,0))
-        cmds.scale(newSize, newSize, newSize, p=(0,25,0)) 
-        cmds.select(deselect=True)
+        with profiler.phase('pruning'):
+            '''This part compacts the attractor lists once at least half of the attractors are gone, keeping their order'''
+            if (self.aliveCount*2 <= len(self.attrList)):
+                keep = [i for i in range(len(self.attrList)) if self.alive[i]]
+                self.attrList = [self.attrList[i] for i in keep]
+                self.closest = [self.closest[i] for i in keep]
+                self.record = [self.record[i] for i in keep]
+                self.nearest = [self.nearest[i] for i in keep]
+                self.idle = [self.idle[i] for i in keep]
+                self.alive = [True]*len(keep)
+            
+        with profiler.phase('averaging'):
+            '''This part averages the directions like stepMVector, going from the last segment to the first so that the random factor is the same'''
+            for j in sorted(attracted, reverse=True):
+                rand = (self.random.uniform(-0.5, 0.5), self.random.uniform(-0.5, 0.5), self.random.uniform(-0.5, 0.5))
+                segmList.average(j, rand)
+                segmList.next(j)
+                segmList.reset(j)
+            
+    def cacheKey(self):
+        ''' Returns the values that decide the shape of the bolt, used as the key of the topology cache. The other engines grow the same bolt, 
+            but the 'frontier' engine retires attractors, so its bolts are cached separately. The key ends with topologyVersion, so that a change to the growth doesn't use the old bolts
+        '''
+        mode = 'frontier%d' % self.stallIterations if self.engine == 'frontier' else 'exact'
+        return (self.seed, self.attrNumber, self.area, self.height, self.minDist, self.maxDist, mode, self.maxIterations or 0, topologyVersion)
         
-        '''This part sets the length of the animation and plays the animation'''
-        cmds.playbackOptions(minTime=0, maxTime=endFrame+15) #the endFrame is the last frame in wich a segment disappeared
-        cmds.play()
-        if(newAnimationContr == False): #if the 'Play animation' checkbox in the GUI is not checked, don't play the animation on creation
-            cmds.play(state=False)
+    def growTopology(self):
+        ''' The heart of the program. It loops through the attractors and segments and determines which ones are to be attracted: in other words, the ones between the minimum and maximum distance(the attractors influence)
+        
+        return           : returns the Topology of the grown bolt, with the frame at which every segment becomes visible
+        '''
+        clock = getattr(time, 'perf_counter', time.time)
+        start = clock()
+        self.stopReason = 'attractors'
+        iterations = 0
+        shown = len(self.segmList) #the origin segment is not shown
+        while (self.attrList): #the loop stops only when all of the attractors are reached
+            if (self.maxIterations and iterations >= self.maxIterations): #the budgets stop the growth, so that an attractor that is never reached can't keep it going forever
+                self.stopReason = 'iterations'
+                break
+            if (self.timeBudget and clock()-start >= self.timeBudget):
+                self.stopReason = 'time'
+                break
+            iterations += 1 #multiple segments can be created for each iteration of the loop: this line keeps track of that value so it can be used later to create the frames of animation  
+            if (self.engine == 'numpy'): #the attraction step is done by the engine chosen in the GUI
+                self.stepNumpy()
+            elif (self.engine == 'grid' or self.engine == 'frontier'):
+                self.stepFrontier()
+            else:
+                self.stepMVector()
+                
+            '''This loop sets the frame of the segments created in this iteration. Segments are only appended, so they are the ones after the last shown segment'''          
+            for i in range (shown, len(self.segmList)):
+                self.segmList.frames[i] = iterations #each segment has a frame for when it will be made visible
+                self.segmList.shown[i] = 1 #the new segment is flagged as shown so that it won't be considered in the next iteration
+            shown = len(self.segmList)
+            profiler.iteration(iterations, len(self.segmList), self.aliveCount if self.engine in ('grid', 'frontier') else len(self.attrList)) #the size of the bolt is only stored while the profiler is on
+        self.iterations = iterations
+        if (self.stopReason != 'attractors'): 
+            print("The growth stopped after %d iterations because of the %s budget, %d attractors were not reached" % (iterations, 'iteration' if self.stopReason == 'iterations' else 'time', 
+                                                                                                                        self.aliveCount if self.engine in ('grid', 'frontier') else len(self.attrList)))
+        return Topology.fromSegments(self.segmList, iterations)
+        
+    def grow(self, newThickness, newSize, newRotation, newColour, newBrightness, brFalloff, colFalloff, newSegmFalloff, newAnimationContr, shaderSteps=32, backend=None):
+        ''' Grows the bolt and builds the lightning, see growTopology and buildLightning
+        
+        On exit          : the lightning is created    
+        '''
+        with profiler.phase('growth', engine=self.engine, attractors=self.attrNumber):
+            topology = self.growTopology()
+        buildLightning(topology, newThickness, newSize, newRotation, newColour, newBrightness, brFalloff, colFalloff, newSegmFalloff, newAnimationContr, shaderSteps, backend)
+
+topologyVersion = 1 #the version of the growth and of the cache files, part of the cache key: it has to be increased whenever a change to the growth changes the bolts, so that the cached bolts grown by the old code aren't used
+
+class Topology: #this class stores a grown bolt as flat arrays, so that it can be cached on disk and the lightning can be built again without growing it
+    def __init__(self, parents, positions, frames, iterations):
+        ''' Initialises the objects attributes
+        
+        parents           : the index of the father of every segment, -1 for the origin
+        positions         : the position of every segment, as x, y, z one after the other
+        frames            : the frame at which every segment becomes visible
+        iterations        : the number of iterations of the growth
+        On exit           : the attributes have been set
+        '''
+        self.parents = parents
+        self.positions = positions
+        self.frames = frames
+        self.iterations = iterations
+        
+    @staticmethod
+    def fromSegments(segmList, iterations):
+        ''' Creates the topology from the SegmentStore of a bolt
+        
+        segmList          : the segments of the bolt
+        iterations        : the number of iterations of the growth
+        return            : returns the Topology
+        '''
+        return Topology(segmList.parents.tolist(), segmList.positions.tolist(), segmList.frames.tolist(), iterations) #the store already keeps the segments as flat arrays
+        
+    def position(self, i):
+        ''' Returns the position of a segment as a Vector
+        '''
+        return Vector(self.positions[3*i], self.positions[3*i+1], self.positions[3*i+2])
+        
+    def save(self, path):
+        ''' Writes the topology to a compressed .npz file, or to a .json file when numpy is not available
+        
+        path              : the path of the file, its extension decides the format
+        On exit           : the file has been written
+        '''
+        if (path.endswith('.npz')):
+            with open(path, 'wb') as npzFile: #the file is opened here, otherwise numpy could change the extension
+                np.savez_compressed(npzFile, parents=np.array(self.parents, dtype=np.int32), positions=np.array(self.positions, dtype=float), 
+                                    frames=np.array(self.frames, dtype=np.int32), iterations=self.iterations)
+        else:
+            with open(path, 'w') as jsonFile:
+                json.dump({'parents': self.parents, 'positions': self.positions, 'frames': self.frames, 'iterations': self.iterations}, jsonFile)
+                
+    @staticmethod
+    def load(path):
+        ''' Reads a topology written by save
+        
+        path              : the path of the file
+        return            : returns the Topology
+        '''
+        if (path.endswith('.npz')):
+            with np.load(path) as data:
+                return Topology(data['parents'].tolist(), data['positions'].tolist(), data['frames'].tolist(), int(data['iterations']))
+        with open(path) as jsonFile:
+            data = json.load(jsonFile)
+        return Topology(data['parents'], data['positions'], data['frames'], data['iterations'])
+        
+class TopologyCache: #this class keeps the grown topologies on disk, so that changing only the look of the lightning doesn't grow it again
+    def __init__(self, directory=None):
+        ''' Initialises the objects attributes
+        
+        directory         : the folder of the cache files, a folder in the temporary directory if it is not given
+        On exit           : the attributes have been set
+        '''
+        if (directory is None):
+            directory = os.path.join(tempfile.gettempdir(), 'lightningCache')
+        self.directory = directory
+        
+    def path(self, key):
+        ''' Returns the path of the cache file of a key
+        
+        key               : the values that decide the shape of the bolt: (seed, attractors, area, height, minDist, maxDist, growth mode, maxIterations, version), see Bolt.cacheKey
+        return            : returns the path of the file
+        '''
+        seed, attrNumber, area, height, minDist, maxDist, mode, maxIterations, version = key
+        name = 'bolt_v%d_%d_%d_%r_%r_%r_%r_%s_%d' % (version, seed, attrNumber, float(area), float(height), float(minDist), float(maxDist), mode, maxIterations)
+        return os.path.join(self.directory, name + ('.json' if np is None else '.npz'))
+        
+    def load(self, key):
+        ''' Returns the cached topology of a key
+        
+        key               : the values that decide the shape of the bolt
+        return            : returns the Topology, or None if it isn't in the cache
+        '''
+        if (key[0] is None): #without a seed the bolt is always different, so it can't be cached
+            return None
+        path = self.path(key)
+        if (not os.path.exists(path)):
+            return None
+        try:
+            return Topology.load(path)
+        except (IOError, OSError, ValueError, KeyError, EOFError, zipfile.BadZipfile): #Error checking: a broken cache file is ignored and the bolt is grown again
+            print("The cache file "+path+" could not be read, the lightning will be grown again")
+            return None
+            
+    def save(self, key, topology):
+        ''' Writes a topology to the cache
+        
+        key               : the values that decide the shape of the bolt
+        topology          : the Topology to cache
+        On exit           : the file has been written
+        '''
+        if (key[0] is None):
+            return
+        if (not os.path.isdir(self.directory)):
+            os.makedirs(self.directory)
+        topology.save(self.path(key))
+        
+topologyCache = TopologyCache() #the only instance of the TopologyCache class
 
+class RenderDispatcher: #this class renders the frames of a scene file in chunks, with several command line renders running at the same time
+    def __init__(self, sceneFile, outputDir, imageName='lightning', extension='iff', executable=None, renderer='sw', workers=2, chunkSize=10, retries=2, progress=None, overwrite=False):
+        ''' Initialises the objects attributes
+        
+        sceneFile         : the path of the scene file to render
+        outputDir         : the folder of the rendered images
+        imageName         : the name of the images, which are written as imageName.0001.extension
+        extension         : the image format
+        executable        : the command of the renderer as a list, Maya's Render next to the running executable if it is not given. A stand-in can be used to test the dispatcher
+        renderer          : the renderer used by Render, Maya software by default
+        workers           : the number of renders running at the same time
+        chunkSize         : the number of frames of each render
+        retries           : the number of times a frame that failed is rendered again
+        progress          : the function called with the number of rendered frames, the number of frames and the failed frames every time a render ends, printProgress if it is not given.
+                            If a render can't be started it is also called with the error
+        overwrite         : boolean that decides if the images already on disk are rendered again. Without it they are skipped, which resumes a render that was stopped
+        On exit           : the attributes have been set
+        '''
+        if (executable is None):
+            executable = [os.path.join(os.path.dirname(sys.executable), 'Render.exe' if os.name == 'nt' else 'Render')]
+        self.sceneFile = sceneFile
+        self.outputDir = outputDir
+        self.imageName = imageName
+        self.extension = extension
+        self.executable = list(executable)
+        self.renderer = renderer
+        self.workers = max(1, workers)
+        self.chunkSize = max(1, chunkSize)
+        self.retries = retries
+        self.progress = progress if progress is not None else self.printProgress
+        self.pollInterval = 0.1 #the number of seconds between the checks of the running renders
+        self.overwrite = overwrite
+        
+    def imagePath(self, frame):
+        ''' Returns the path of the image of a frame
+        '''
+        return os.path.join(self.outputDir, '%s.%04d.%s' % (self.imageName, frame, self.extension))
+        
+    def command(self, start, end):
+        ''' Returns the command line that renders the frames from start to end
+        '''
+        return self.executable + ['-r', self.renderer, '-s', str(start), '-e', str(end), '-rd', self.outputDir, '-im', self.imageName, 
+                                  '-of', self.extension, '-fnc', '3', '-pad', '4', self.sceneFile] #-fnc 3 writes the images as name.#.ext
+                                  
+    def chunks(self, frames):
+        ''' Splits a list of frames into chunks of consecutive frames, no longer than chunkSize
+        
+        frames            : the frames to render
+        return            : returns a list of lists of frames
+        '''
+        chunks = []
+        for frame in sorted(frames):
+            if (chunks and frame == chunks[-1][-1]+1 and len(chunks[-1]) < self.chunkSize):
+                chunks[-1].append(frame)
+            else:
+                chunks.append([frame])
+        return chunks
+        
+    def printProgress(self, rendered, total, failed, error=None):
+        print('Rendered %d of %d frames' % (rendered, total) + (', failed: '+' '.join(str(frame) for frame in failed) if failed else ''))
+        if (error is not None):
+            print('The render was stopped: %s' % error)
+        
+    def run(self, firstFrame, lastFrame):
+        ''' Renders the frames from firstFrame to lastFrame, skipping the ones whose image already exists unless overwrite is on.
+            A frame is rendered when its image exists after its render has ended, so a render that crashes halfway only loses the frames it didn't write
+        
+        firstFrame        : the first frame
+        lastFrame         : the last frame
+        return            : returns a dictionary with the lists of rendered, skipped and failed frames, and the error that stopped the render or None
+        '''
+        if (not os.path.isdir(self.outputDir)):
+            os.makedirs(self.outputDir)
+        frames = list(range(firstFrame, lastFrame+1))
+        if (self.overwrite): #the old images are removed first, as a frame is only rendered when its image exists after its render
+            for frame in frames:
+                if (os.path.exists(self.imagePath(frame))):
+                    os.remove(self.imagePath(frame))
+        skipped = [frame for frame in frames if os.path.exists(self.imagePath(frame))] #the frames already on disk, for example from a render that was stopped
+        queue = collections.deque(self.chunks(set(frames) - set(skipped)))
+        attempts = collections.Counter()
+        rendered = []
+        failed = []
+        running = [] #the render processes, with the frames of each of them
+        
+        with open(os.devnull, 'w') as devnull:
+            while (queue or running):
+                while (queue and len(running) < self.workers):
+                    chunk = queue.popleft()
+                    try:
+                        running.append((subprocess.Popen(self.command(chunk[0], chunk[-1]), stdout=devnull, stderr=subprocess.STDOUT), chunk))
+                    except OSError as error: #Error checking: the renderer could be missing. The renders already started are stopped and the frames left are failed
+                        for process, runningChunk in running:
+                            process.terminate()
+                            process.wait()
+                            queue.append(runningChunk)
+                        queue.append(chunk)
+                        failed.extend(frame for queuedChunk in queue for frame in queuedChunk if not os.path.exists(self.imagePath(frame)))
+                        rendered.extend(frame for queuedChunk in queue for frame in queuedChunk if os.path.exists(self.imagePath(frame)))
+                        self.progress(len(rendered)+len(skipped), len(frames), sorted(failed), error)
+                        return {'rendered': sorted(rendered), 'skipped': skipped, 'failed': sorted(failed), 'error': error}
+                time.sleep(self.pollInterval)
+                for process, chunk in list(running):
+                    if (process.poll() is None):
+                        continue
+                    running.remove((process, chunk))
+                    retry = []
+                    for frame in chunk:
+                        if (os.path.exists(self.imagePath(frame))):
+                            rendered.append(frame)
+                            continue
+                        attempts[frame] += 1
+                        if (attempts[frame] > self.retries):
+                            failed.append(frame)
+                        else:
+                            retry.append(frame)
+                    queue.extend(self.chunks(retry)) #the missing frames are rendered again, after the frames that haven't been tried yet
+                    self.progress(len(rendered)+len(skipped), len(frames), sorted(failed))
+        return {'rendered': sorted(rendered), 'skipped': skipped, 'failed': sorted(failed), 'error': None}
+        
+        
+def buildTubes(topology, newThickness, newSegmFalloff, lod=None, scale=1.0):
+    ''' Finds the radius of every segment, except for the origin, and builds their tubes in the mesh of their frame
+    
+    topology         : the Topology of the bolt, grown or loaded from the cache
+    newThickness     : the initial radius of the lightning segments, from the GUI
+    newSegmFalloff   : boolean that decides if the radius decreases as the lightning grows, from the GUI
+    lod              : the LevelOfDetail of the geometry, a tube of 12 sides for every segment if it is not given
+    scale            : the scale of the lightning, from the GUI, used by the level of detail
+    return           : returns the MeshBuilder with the geometry of every frame
+    '''
+    if (lod is None):
+        lod = LevelOfDetail()
+    radii = [0.0]*len(topology.parents)
+    for i in range (len(topology.parents)):
+        if (topology.parents[i] < 0): #this line makes sure the origin segment is not shown
+            continue
+        frame = topology.frames[i]
+        radiusDecrease = frame*0.001 #based on the frame number, the radius decreases by a certain amount
+        if (newSegmFalloff == False): #the radius decrease can also be turned off by the user: segmFalloff comes from the GUI
+            radiusDecrease=0
+        radius = (0.1 - (radiusDecrease))
+        if (radius <= 0): #Error checking: if the radius gets smaller than zero, it gets set to a positive value
+            radius = 0.0001
+        radii[i] = radius*newThickness #the tube goes from the parent to the segment, with a thickness multiplier from the GUI
+    return lod.build(topology, radii, scale)
+    
+def buildKeys(frames, iterations, holdFrames, frameOffset=0):
+    ''' Adds the keys that make the mesh of every frame appear and disappear
+    
+    frames           : the frames of the meshes
+    iterations       : the number of iterations the bolt took to grow
+    holdFrames       : the number of frames the finished lightning stays visible before it starts to disappear, from the GUI
+    frameOffset      : the number of frames the whole animation is delayed by, used to stagger the bolts of a storm
+    return           : returns the AnimationStage with the keys and the last frame in which a mesh disappears
+    '''
+    animation = AnimationStage()
+    minIterations = iterations+holdFrames #minIterations is the first frame of the second half of the animation
+    endFrame = minIterations + frameOffset
+    for frame in sorted(frames):
+        startFrame = frame + frameOffset
+        animation.addKey(frame, startFrame-1, 0)
+        animation.addKey(frame, startFrame, 1)
+        endFrame = startFrame + minIterations #the animation is practically reversed. The segments disappear with an offset of minIter from when they were initially made visible
+        animation.addKey(frame, endFrame-1, 1)
+        animation.addKey(frame, endFrame, 0)
+    return animation, endFrame
+    
+def buildLightning(topology, newThickness, newSize, newRotation, newColour, newBrightness, brFalloff, colFalloff, newSegmFalloff, newAnimationContr, shaderSteps=32, backend=None, holdFrames=20, 
+                   groupName='Lightning', offset=(0, 0, 0), frameOffset=0, playback=True, lod=None):
+    ''' Builds the geometry, shading and animation of a grown bolt
+    
+    topology         : the Topology of the bolt, grown or loaded from the cache
+    newThickness     : the initial radius of the lightning segments, from the GUI
+    newSize          : the value for which the lightning should be scaled, from the GUI
+    newRotation      : the value for which the lightning should be rotated, from the GUI
+    newColour        : the colour decided by the user, from the GUI
+    newBrightness    : the brightness value, from the GUI
+    brFalloff        : boolean that decides if the brightness decreases as the lightning grows, from the GUI
+    colFalloff       : boolean that decides if the colour value decreases as the lightning grows, from the GUI
+    newSegmFalloff   : boolean that decides if the radius decreases as the lightning grows, from the GUI
+    newAnimationContr: boolean that decides if the animation should play when the lightning is created, from the GUI 
+    shaderSteps      : the number of shaders the colour and brightness falloff is divided into, from the GUI
+    backend          : the backend that builds the scene, a MayaBackend if it is not given
+    holdFrames       : the number of frames the finished lightning stays visible before it starts to disappear, from the GUI
+    groupName        : the name of the group of the meshes
+    offset           : the translation of the group, used to spread the bolts of a storm
+    frameOffset      : the number of frames the animation is delayed by, used to stagger the bolts of a storm
+    playback         : boolean that decides if the length of the animation is set, the storm sets it once for all of its bolts
+    lod              : the LevelOfDetail of the geometry, a tube of 12 sides for every segment if it is not given
+    return           : returns a dictionary with the mesh of every frame, the name of the group, the last frame in which a mesh disappears 
+                       and a dictionary with the curves of every frame
+    On exit          : the lightning is created    
+    '''
+    if (backend is None):
+        backend = MayaBackend()
+    with profiler.phase('geometry', segments=len(topology.parents)):
+        builder = buildTubes(topology, newThickness, newSegmFalloff, lod, newSize)
+    animation, endFrame = buildKeys(set(builder.meshes) | set(builder.curves), topology.iterations, holdFrames, frameOffset)
+    
+    '''This part creates one mesh for every frame, assigns the shaders and writes the animation of each of them'''        
+    with profiler.phase('meshes', meshes=len(builder.meshes), curves=len(builder.curves)):
+        meshNames = builder.emit(backend, groupName+'_segments_') #the names start with the name of the group, so that the meshes of different bolts never share a name
+        curveNames = builder.emitCurves(backend, groupName+'_tips_') #the curves that replace the thinnest segments have no shader, but appear and disappear with the meshes
+    with profiler.phase('shading'):
+        shaderPool.assign(backend, meshNames, shaderSteps, newColour, newBrightness, brFalloff, colFalloff) #the shader pool assigns colour and brightness to the segments
+    with profiler.phase('keyframing'):
+        animation.write(backend, meshNames)
+        animation.write(backend, curveNames)
+    
+    '''This part groups all the meshes together'''
+    with profiler.phase('group'):
+        groupName = backend.group(list(meshNames.values()) + list(curveNames.values()), groupName)
+    
+    '''This section rotates and scales the fineshed Lightning mesh based on imput from the GUI'''
+    with profiler.phase('transform'):
+        backend.transformGroup(groupName, newRotation, newSize, (0,25,0), offset)
+    
+    '''This part sets the length of the animation and plays the animation'''
+    if (playback):
+        backend.playback(endFrame+15, newAnimationContr) #the endFrame is the last frame in wich a segment disappeared
+    return meshNames, groupName, endFrame, curveNames
 
-def actionProc(winID, attractorsNumber, thicknessControl, heightControl, areaControl, rotationControl, scalingControl, segmSizeFalloff, brightnessControl, colourControl, brightnessFalloff, colourFalloff, animationControl, *pArgs):
-    ''' Assignes the values retrieved from the GUI to new variables, deletes the previous iteration of the lightning and calls the main methods
+def updateLightning(settings, old, backend):
+    ''' Updates the existing lightning in place, changing only the parts affected by the settings that differ from the ones it was created with
     
-    imput           : all of the values retrieved from the GUI
-    On exit         : all of the values retrieved from the GUI are assigned to variables
+    settings         : a dictionary with the values retrieved from the GUI
+    old              : the settings the existing lightning was created with, stored in its group
+    backend          : the backend that builds the scene, MayaBackend or RecordingBackend
+    return           : returns False if the lightning has to be built again, True otherwise
     '''
-    newAttrNumber = cmds.intSliderGrp(attractorsNumber, query=True, value=True) #the number of initial attractors in the scene
-    newThickness = cmds.floatSliderGrp(thicknessControl, query=True, value=True) #the radius of the lightning segments
-    newHeight = cmds.floatSliderGrp(heightControl, query=True, value=True) #the height at which the origin segment is placed
-    newArea = cmds.intSliderGrp(areaControl, query=True, value=True) #the area in which the attractors are placed
-    newRotation = cmds.intSliderGrp(rotationControl, query=True, value=True) #the value for which the lightning should be rotated
-    newSize = cmds.floatSliderGrp(scalingControl, query=True, value=True) #the value for which the lightning should be scaled
-    newSegmFalloff = cmds.checkBoxGrp(segmSizeFalloff, query=True, value1=True) #a boolean that establishes if the radius decreases as the lightning grows
-    newBrightness = cmds.floatSliderGrp(brightnessControl, query=True, value=True) #the value of the lightnings brightness
-    newColour = cmds.colorSliderGrp(colourControl, query=True, rgbValue=True) #the lightnings colour
-    newBrFalloff = cmds.checkBoxGrp(brightnessFalloff, query=True, value1=True) #a boolean that establishes if the brightness decreases as the lightning grows
-    newColFalloff = cmds.checkBoxGrp(colourFalloff, query=True, value1=True) #a boolean that establishes if the colour gets darker as the lightning grows  
-    newAnimationContr = cmds.checkBoxGrp(animationControl, query=True, value1=True) #a boolean that establishes if the animation should get played upon the creation of the segment    
+    if (settings['lod'] != old['lod']): #a different level of detail changes the polygons of the meshes
+        return False
+    lod = LevelOfDetail(**settings['lod'])
+    meshNames = dict((int(frame), name) for frame, name in old['meshNames'].items()) #the keys of a JSON dictionary are always strings
+    curveNames = dict((int(frame), name) for frame, name in old['curveNames'].items())
+    for name in list(meshNames.values()) + list(curveNames.values()):
+        if (backend.exists(name) == False): #Error checking: a mesh could have been deleted from the scene since it was created
+            return False
+            
+    '''This part moves the vertices of the meshes if the thickness changed. The topology is loaded from the cache'''
+    if (settings['thickness'] != old['thickness'] or settings['segmFalloff'] != old['segmFalloff'] or (settings['size'] != old['size'] and not lod.isFixed())):
+        if (not lod.isFixed()): #the number of sides and the culled segments depend on the radius, so the meshes are built again
+            return False
+        topology = topologyCache.load(settings['key'])
+        if (topology is None):
+            return False
+        builder = buildTubes(topology, settings['thickness'], settings['segmFalloff'], lod, settings['size'])
+        if (sorted(builder.meshes) != sorted(meshNames)):
+            return False
+        for frame in sorted(meshNames):
+            backend.setMeshPoints(meshNames[frame], builder.meshes[frame][0])
+            
+    '''This part changes the shaders. If the falloff steps of the meshes are the same, the shaders are edited instead of assigned again'''
+    look = [settings['colour'], settings['brightness'], settings['brFalloff'], settings['colFalloff']]
+    oldLook = [old['colour'], old['brightness'], old['brFalloff'], old['colFalloff']]
+    if (look != oldLook or settings['shaderSteps'] != old['shaderSteps']):
+        falloff = settings['brFalloff'] or settings['colFalloff']
+        oldFalloff = old['brFalloff'] or old['colFalloff']
+        if (settings['shaderSteps'] == old['shaderSteps'] and falloff == oldFalloff):
+            shaderPool.recolour(backend, settings['shaderSteps'], oldLook, look, meshNames.values())
+        shaderPool.assign(backend, meshNames, settings['shaderSteps'], *look) #after recolour every shader is already in the pool, and this only makes sure they are assigned
+        
+    '''This part retimes the animation'''
+    animation, endFrame = buildKeys(set(meshNames) | set(curveNames), old['iterations'], settings['holdFrames'])
+    if (settings['holdFrames'] != old['holdFrames']):
+        animation.write(backend, meshNames)
+        animation.write(backend, curveNames)
+        
+    '''This part transforms the group and sets the animation'''
+    if (settings['rotation'] != old['rotation'] or settings['size'] != old['size']):
+        backend.transformGroup('Lightning', settings['rotation'], settings['size'], (0,25,0))
+    if (settings['holdFrames'] != old['holdFrames'] or settings['animation'] != old['animation']):
+        backend.playback(endFrame+15, settings['animation'])
+    settings['meshNames'] = old['meshNames']
+    settings['curveNames'] = old['curveNames']
+    settings['iterations'] = old['iterations']
+    return True
+    
+def applyLightning(settings, backend=None):
+    ''' Creates the lightning. If the lightning already exists and its shape is the same, it is updated in place instead of being deleted and built again
     
+    settings         : a dictionary with the values retrieved from the GUI
+    backend          : the backend that builds the scene, a MayaBackend if it is not given
+    return           : returns True if the lightning was updated in place, False if it was built
+    On exit          : the lightning is created and its settings are stored in its group
+    '''
+    if (backend is None):
+        backend = MayaBackend()
+    lightning = Bolt(settings['attractors'], settings['area'], settings['height'], settings['engine'], settings['seed'], settings['maxIterations'], settings['timeBudget'])
+    settings['key'] = list(lightning.cacheKey()) #only these values change the shape of the bolt: the others only change its look
+    
+    '''This section reads the settings of the previous iteration of the lightning, and updates it if only its look changed'''
+    old = None
+    text = backend.getSettings('Lightning')
+    if (text is not None):
+        try:
+            old = json.loads(text)
+        except ValueError: #Error checking: the attribute could have been edited by hand
+            old = None
+    if (old is not None and old.get('key') == settings['key']):
+        try:
+            with profiler.phase('update'):
+                updated = updateLightning(settings, old, backend)
+            if (updated):
+                backend.setSettings('Lightning', json.dumps(settings))
+                return True
+        except KeyError: #Error checking: the settings could come from an older version of the script
+            pass
+            
     '''This section deletes the previous iteration of the lightning if it exists'''
-    if cmds.objExists('Lightning'):
-        cmds.delete('Lightning') #the name of the group should not be changed manually, as doing so will create segments with the same name
+    if (backend.exists('Lightning')):
+        backend.delete('Lightning') #the name of the group should not be changed manually, as doing so will create segments with the same name
         
-    '''This section creates the only instance of the bolt class and calls the grow function. All of the variables are values retrieved from the GUI'''    
-    lightning = Bolt(newAttrNumber, newArea, newHeight)
-    lightning.grow(newThickness, newSize, newRotation, newColour, newBrightness, newBrFalloff, newColFalloff, newSegmFalloff, newAnimationContr)
+    '''This section grows the bolt, unless the same bolt is already in the cache, and builds it'''
+    with profiler.phase('cache'):
+        topology = topologyCache.load(settings['key'])
+    if (topology is None):
+        with profiler.phase('growth', engine=settings['engine'], attractors=settings['attractors']):
+            topology = lightning.growTopology()
+        if (lightning.stopReason != 'time'): #a bolt stopped by the time budget depends on the speed of the machine, so it isn't cached
+            topologyCache.save(settings['key'], topology)
+    meshNames, groupName, endFrame, curveNames = buildLightning(topology, settings['thickness'], settings['size'], settings['rotation'], settings['colour'], settings['brightness'], settings['brFalloff'], 
+                                                                settings['colFalloff'], settings['segmFalloff'], settings['animation'], settings['shaderSteps'], backend, settings['holdFrames'], 
+                                                                lod=LevelOfDetail(**settings['lod']))
+    settings['meshNames'] = dict((str(frame), name) for frame, name in meshNames.items())
+    settings['curveNames'] = dict((str(frame), name) for frame, name in curveNames.items())
+    settings['iterations'] = topology.iterations
+    backend.setSettings('Lightning', json.dumps(settings))
+    return False
+
+def stormJobs(count, seed=0, attrRange=(60, 200), areaRange=(10, 40), heightRange=(8, 15), engine='grid'):
+    ''' Picks the parameters of the bolts of a storm: every bolt gets a distinct seed, and its attractors, area and height are picked in the given ranges
+    
+    count            : the number of bolts
+    seed             : the random seed of the storm, the same seed always picks the same bolts
+    attrRange        : the minimum and maximum number of attractors
+    areaRange        : the minimum and maximum area
+    heightRange      : the minimum and maximum height of the origin
+    engine           : the growth engine
+    return           : returns a list with a tuple (seed, attractors, area, height, engine) for every bolt
+    '''
+    rng = random.Random(seed)
+    jobs = []
+    for boltSeed in rng.sample(range(100000), count): #the seeds are picked in the same range as the seeds of the GUI
+        jobs.append((boltSeed, rng.randint(attrRange[0], attrRange[1]), rng.randint(areaRange[0], areaRange[1]), round(rng.uniform(heightRange[0], heightRange[1]), 2), engine))
+    return jobs
+    
+def growStormBolt(job):
+    ''' Grows one bolt of a storm. It is called by the worker processes, so it only uses the growth core, which doesn't depend on Maya
+    
+    job              : a tuple with the seed, attractors, area, height and growth engine of the bolt, and the folder of the topology cache or None
+    return           : returns the Topology of the bolt, which is small enough to be sent back to the main session
+    '''
+    seed, attrNumber, area, height, engine, cacheDirectory = job
+    lightning = Bolt(attrNumber, area, height, engine, seed)
+    cache = None if cacheDirectory is None else TopologyCache(cacheDirectory)
+    key = lightning.cacheKey()
+    topology = None if cache is None else cache.load(key)
+    if (topology is None):
+        topology = lightning.growTopology()
+        if (cache is not None and lightning.stopReason != 'time'):
+            cache.save(key, topology)
+    return topology
+    
+def growStorm(jobs, processes=None, cache=True):
+    ''' Grows the bolts of a storm in a pool of worker processes
+    
+    jobs             : the parameters of the bolts, see stormJobs
+    processes        : the number of worker processes, one for every core if it is not given. With 1 the bolts are grown in this process
+    cache            : boolean that decides if the topologies are read from and written to the topology cache
+    return           : returns the Topology of every bolt, in the order of the jobs
+    '''
+    cacheDirectory = topologyCache.directory if cache else None
+    tasks = [tuple(job) + (cacheDirectory,) for job in jobs]
+    mainModule = sys.modules.get('__main__')
+    if (growStormBolt.__module__ == '__main__' and cmds is not None and not hasattr(mainModule, '__file__')): #Error checking: the workers can't find this function if the script was run from the Script Editor
+        print("The script has to be imported as a module to grow the storm in parallel, the bolts will be grown one after the other")
+        processes = 1
+    if (processes == 1 or len(tasks) < 2):
+        return [growStormBolt(task) for task in tasks]
+        
+    '''This part sends the biggest bolts first, so that a big bolt at the end of the list doesn't keep one worker busy while the others wait'''
+    order = sorted(range(len(tasks)), key=lambda i: -tasks[i][1])
+    context = multiprocessing.get_context('spawn') #the workers are started as new processes, as forking would copy the whole Maya session into each of them
+    if (cmds is not None): #inside of Maya the workers are started with mayapy, as the Maya executable would open a new session
+        mayapy = os.path.join(os.path.dirname(sys.executable), 'mayapy.exe' if os.name == 'nt' else 'mayapy')
+        if (os.path.exists(mayapy)):
+            context.set_executable(mayapy) #only this context is changed, not the one used by the other tools in the session
+    pool = context.Pool(processes)
+    try:
+        results = pool.map(growStormBolt, [tasks[i] for i in order], chunksize=1) #with one bolt per chunk the workers take a new bolt as soon as they are free
+    finally:
+        pool.close()
+        pool.join()
+    topologies = [None]*len(tasks)
+    for i, topology in zip(order, results):
+        topologies[i] = topology
+    return topologies
+    
+def buildStorm(topologies, newThickness, newSize, newRotation, newColour, newBrightness, brFalloff, colFalloff, newSegmFalloff, newAnimationContr, shaderSteps=32, 
+               backend=None, holdFrames=20, spread=60, stagger=30, seed=0, lod=None):
+    ''' Builds the bolts of a storm in the scene, spread around the origin and with their animations staggered in time
+    
+    topologies       : the Topology of every bolt, see growStorm
+    spread           : the maximum distance of a bolt from the origin, on the x and z axes
+    stagger          : the maximum number of frames a bolt is delayed by
+    seed             : the random seed of the offsets and delays
+    lod              : the LevelOfDetail of the geometry of every bolt
+    backend          : the backend that builds the scene, a MayaBackend if it is not given
+    return           : returns the names of the groups of the bolts
+    On exit          : the storm is created. The other values are the same as the ones of buildLightning
+    '''
+    if (backend is None):
+        backend = MayaBackend()
+    if (backend.exists('Storm')): #the previous storm is deleted, the same way as the lightning
+        backend.delete('Storm')
+    rng = random.Random(seed)
+    groupNames = []
+    endFrame = 0
+    for i in range(len(topologies)):
+        offset = (rng.uniform(-spread, spread), 0, rng.uniform(-spread, spread))
+        frameOffset = rng.randint(0, stagger)
+        groupName, boltEnd = buildLightning(topologies[i], newThickness, newSize, newRotation, newColour, newBrightness, brFalloff, colFalloff, newSegmFalloff, newAnimationContr, 
+                                            shaderSteps, backend, holdFrames, 'Storm_'+str(i+1), offset, frameOffset, False, lod)[1:3]
+        groupNames.append(groupName)
+        endFrame = max(endFrame, boltEnd)
+    backend.group(groupNames, 'Storm')
+    backend.playback(endFrame+15, newAnimationContr) #the animation lasts until the last bolt disappears
+    return groupNames
+    
+def actionProc(winID, attractorsNumber, thicknessControl, heightControl, areaControl, rotationControl, scalingControl, segmSizeFalloff, brightnessControl, colourControl, brightnessFalloff, colourFalloff, animationControl, engineControl, shaderStepsControl, seedControl, newSeedControl, holdControl, maxIterationsControl, timeBudgetControl, 
+               maxSidesControl, edgeLengthControl, framesPerMeshControl, tipModeControl, tipRadiusControl, polygonBudgetControl, profileControl, profileFileControl, *pArgs):
+    ''' Assignes the values retrieved from the GUI to new variables and creates or updates the lightning
+    
+    imput           : all of the values retrieved from the GUI
+    On exit         : all of the values retrieved from the GUI are assigned to variables
+    '''
+    settings = {}
+    settings['attractors'] = cmds.intSliderGrp(attractorsNumber, query=True, value=True) #the number of initial attractors in the scene
+    settings['thickness'] = cmds.floatSliderGrp(thicknessControl, query=True, value=True) #the radius of the lightning segments
+    settings['height'] = cmds.floatSliderGrp(heightControl, query=True, value=True) #the height at which the origin segment is placed
+    settings['area'] = cmds.intSliderGrp(areaControl, query=True, value=True) #the area in which the attractors are placed
+    settings['rotation'] = cmds.intSliderGrp(rotationControl, query=True, value=True) #the value for which the lightning should be rotated
+    settings['size'] = cmds.floatSliderGrp(scalingControl, query=True, value=True) #the value for which the lightning should be scaled
+    settings['segmFalloff'] = cmds.checkBoxGrp(segmSizeFalloff, query=True, value1=True) #a boolean that establishes if the radius decreases as the lightning grows
+    settings['brightness'] = cmds.floatSliderGrp(brightnessControl, query=True, value=True) #the value of the lightnings brightness
+    settings['colour'] = list(cmds.colorSliderGrp(colourControl, query=True, rgbValue=True)) #the lightnings colour
+    settings['brFalloff'] = cmds.checkBoxGrp(brightnessFalloff, query=True, value1=True) #a boolean that establishes if the brightness decreases as the lightning grows
+    settings['colFalloff'] = cmds.checkBoxGrp(colourFalloff, query=True, value1=True) #a boolean that establishes if the colour gets darker as the lightning grows  
+    settings['shaderSteps'] = cmds.intSliderGrp(shaderStepsControl, query=True, value=True) #the number of shaders used for the colour and brightness falloff
+    settings['animation'] = cmds.checkBoxGrp(animationControl, query=True, value1=True) #a boolean that establishes if the animation should get played upon the creation of the segment    
+    settings['holdFrames'] = cmds.intSliderGrp(holdControl, query=True, value=True) #the number of frames the finished lightning stays visible
+    settings['engine'] = cmds.optionMenuGrp(engineControl, query=True, value=True) #the growth engine used to calculate the attraction step
+    settings['maxIterations'] = cmds.intSliderGrp(maxIterationsControl, query=True, value=True) #the growth stops after this number of iterations
+    settings['timeBudget'] = cmds.floatSliderGrp(timeBudgetControl, query=True, value=True) #the growth stops after this number of seconds
+    settings['lod'] = LevelOfDetail(maxSides=cmds.intSliderGrp(maxSidesControl, query=True, value=True), #the level of detail of the geometry of the segments
+                                    edgeLength=cmds.floatSliderGrp(edgeLengthControl, query=True, value=True),
+                                    framesPerMesh=cmds.intSliderGrp(framesPerMeshControl, query=True, value=True),
+                                    tipMode=cmds.optionMenuGrp(tipModeControl, query=True, value=True),
+                                    tipRadius=cmds.floatSliderGrp(tipRadiusControl, query=True, value=True),
+                                    polygonBudget=cmds.intSliderGrp(polygonBudgetControl, query=True, value=True)).settings()
+    settings['seed'] = cmds.intFieldGrp(seedControl, query=True, value1=True) #the random seed: the same seed always grows the same lightning
+    if (cmds.checkBoxGrp(newSeedControl, query=True, value1=True)): #if the 'New seed on Apply' checkbox is checked, a new seed is picked and shown in the GUI
+        settings['seed'] = random.randint(0, 99999)
+        cmds.intFieldGrp(seedControl, edit=True, value1=settings['seed'])
+        
+    '''This section creates the lightning, or updates it if only its look changed. If the 'Profile Apply' checkbox is checked, the phases of the Apply are timed and written to the profile file'''
+    profile = cmds.checkBoxGrp(profileControl, query=True, value1=True)
+    profiler.stop() #the profiler could be on from the LIGHTNING_PROFILE environment variable: it only runs during an Apply that is profiled, so that it doesn't keep collecting for the rest of the session
+    profiler.reset()
+    if (profile):
+        profiler.start()
+    try:
+        applyLightning(settings)
+    finally:
+        if (profile):
+            profiler.stop()
+            profilePath = cmds.textFieldGrp(profileFileControl, query=True, text=True)
+            profiler.write(profilePath)
+            profiler.printSummary()
+            print("The profile was written to %s" % profilePath)
     
 def cancelProc(winID,*pArgs):
     ''' Deletes the GUI if the 'Cancel' button is pressed
@@ -295,14 +2075,62 @@ def renderFunc(winID, *pArgs):
     '''
     cmds.render()
  
-def batchRenderFunc(winID, *pArgs):
-    ''' Batch renders the animation if the 'Batch render in current path' button is pressed. Maya software should be used for rendering
+def batchRenderFunc(winID, workersControl, overwriteControl, *pArgs):
+    ''' Batch renders the animation if the 'Batch render in current path' button is pressed. Maya software should be used for rendering.
+        The scene is exported to a temporary file and its frames are rendered by several command line renders in the background, so that Maya can still be used.
+        If the 'Overwrite images' checkbox is not checked, the frames already rendered are skipped, which resumes a batch render that was stopped
     '''
     lastFrame= cmds.playbackOptions(q=True, max=True)
     lastFrameInt= int(lastFrame)
-    for i in range(lastFrameInt+1): #this part loops through the frames and renders them until the last frame is reached
-        cmds.currentTime(i)
-        cmds.render()
+    workers = cmds.intSliderGrp(workersControl, query=True, value=True) #the number of renders running at the same time
+    sceneHandle, sceneFile = tempfile.mkstemp(suffix='.mb', prefix='lightningRender') #every batch render gets its own scene file, so that another click doesn't overwrite the scene of the renders still running
+    os.close(sceneHandle)
+    cmds.file(sceneFile, exportAll=True, type='mayaBinary', force=True) #the renders read the scene from disk, so the current state of the scene is exported without renaming it
+    outputDir = os.path.join(cmds.workspace(query=True, rootDirectory=True), cmds.workspace(fileRuleEntry='images')) #the same folder cmds.render writes to
+    
+    def progress(rendered, total, failed, error=None): #the renders are checked in another thread, so the progress is printed by Maya's main thread
+        maya.utils.executeDeferred(dispatcher.printProgress, rendered, total, failed, error)
+    def render():
+        try:
+            dispatcher.run(0, lastFrameInt) #this part renders the frames until the last frame is reached
+        finally:
+            os.remove(sceneFile)
+    dispatcher = RenderDispatcher(sceneFile, outputDir, workers=workers, progress=progress, overwrite=cmds.checkBoxGrp(overwriteControl, query=True, value1=True))
+    thread = threading.Thread(target=render)
+    thread.daemon = True
+    thread.start()
+    
+def standInRenderFunc(args):
+    ''' A stand-in for Maya's Render, used to test the RenderDispatcher without Maya. It takes the same arguments and writes a small text file for every frame:
+        python Lightning_script_final_2.py --stand-in-render -s 1 -e 10 -rd images -im lightning -of iff scene.mb
+    
+    args            : the command line arguments. The frames after -fail are never written, the ones after -failOnce are only written the second time they are rendered
+    On exit         : the images have been written
+    '''
+    parser = argparse.ArgumentParser(description='Stand-in for the command line render of Maya')
+    parser.add_argument('-r', default='sw')
+    parser.add_argument('-s', type=int, required=True)
+    parser.add_argument('-e', type=int, required=True)
+    parser.add_argument('-rd', required=True)
+    parser.add_argument('-im', required=True)
+    parser.add_argument('-of', default='iff')
+    parser.add_argument('-fnc')
+    parser.add_argument('-pad', type=int, default=4)
+    parser.add_argument('-fail', type=int, nargs='*', default=[])
+    parser.add_argument('-failOnce', type=int, nargs='*', default=[])
+    parser.add_argument('sceneFile')
+    options = parser.parse_args(args)
+    
+    for frame in range(options.s, options.e+1):
+        path = os.path.join(options.rd, '%s.%0*d.%s' % (options.im, options.pad, frame, options.of))
+        marker = path+'.failed' #the marker of a frame that already failed once
+        if (frame in options.fail):
+            continue
+        if (frame in options.failOnce and not os.path.exists(marker)):
+            open(marker, 'w').close()
+            continue
+        with open(path, 'w') as imageFile:
+            imageFile.write('%s frame %d\n' % (options.sceneFile, frame))
             
 def createUI():
     ''' Prompts the user with values that will change the appearance of the lightning mesh
@@ -331,6 +2159,15 @@ def createUI():
     rotationControl = cmds.intSliderGrp(label="Rotation angle", minValue=0, maxValue=360, value=315, field=True) #slider for the rotation value
     scalingControl = cmds.floatSliderGrp(label="Scaling value", minValue=0.1, maxValue=10, value=1, step=0.01, field=True) #slider for the scale value
     segmSizeFalloff = cmds.checkBoxGrp(label="Segment size falloff", value1=True) #checkbox for the radius getting smaller as the lightning grows
+    engineControl = cmds.optionMenuGrp(label="Growth engine") #menu for the growth engine: the numpy engine is faster with a high concentration of attractors
+    cmds.menuItem(label="mvector")
+    cmds.menuItem(label="numpy")
+    cmds.menuItem(label="grid")
+    cmds.menuItem(label="frontier")
+    maxIterationsControl = cmds.intSliderGrp(label="Max iterations", minValue=0, maxValue=5000, value=1000, step=1, field=True) #slider for the iteration budget of the growth, 0 for no limit
+    timeBudgetControl = cmds.floatSliderGrp(label="Time budget (s)", minValue=0, maxValue=60, value=0, step=0.5, field=True) #slider for the time budget of the growth, 0 for no limit
+    seedControl = cmds.intFieldGrp(label="Seed", value1=1) #field for the random seed
+    newSeedControl = cmds.checkBoxGrp(label="New seed on Apply", value1=False) #checkbox for picking a new random seed every time the lightning is created
     cmds.setParent("..")
     
     cmds.frameLayout(borderVisible=True, label="Shader") #subsection for the material
@@ -338,24 +2175,161 @@ def createUI():
     colourControl = cmds.colorSliderGrp(label="Colour", rgb=[0.550, 0.550, 1]) #slider for the colour value
     brightnessFalloff = cmds.checkBoxGrp(label="Brightness falloff", value1=True) #checkbox for the brighness decreasing as the lightning grows   
     colourFalloff = cmds.checkBoxGrp(label="Colour falloff", value1=True) #checkbox for the colour decreasing as the lightning grows 
+    shaderStepsControl = cmds.intSliderGrp(label="Shader steps", minValue=1, maxValue=100, value=32, step=1, field=True) #slider for the number of shaders shared by the segments
+    cmds.setParent("..")
+    
+    cmds.frameLayout(borderVisible=True, label="Geometry") #subsection for the level of detail of the segments
+    maxSidesControl = cmds.intSliderGrp(label="Max sides", minValue=3, maxValue=24, value=12, step=1, field=True) #slider for the number of sides of the thickest segments
+    edgeLengthControl = cmds.floatSliderGrp(label="Edge length", minValue=0.0, maxValue=0.5, value=0.0, step=0.01, field=True) #slider for the size of the sides, which decides the number of sides from the radius. 0 keeps every segment at the maximum
+    framesPerMeshControl = cmds.intSliderGrp(label="Frames per mesh", minValue=1, maxValue=20, value=1, step=1, field=True) #slider for the number of frames in each mesh: the chains of segments in a mesh are merged into one tube
+    tipModeControl = cmds.optionMenuGrp(label="Thin tips") #menu for the segments thinner than the tip radius
+    cmds.menuItem(label="keep")
+    cmds.menuItem(label="cull")
+    cmds.menuItem(label="curve")
+    tipRadiusControl = cmds.floatSliderGrp(label="Tip radius", minValue=0.0, maxValue=0.1, value=0.001, step=0.001, field=True) #slider for the radius of the thinnest segment that is still a tube
+    polygonBudgetControl = cmds.intSliderGrp(label="Polygon budget", minValue=0, maxValue=500000, value=0, step=1000, field=True) #slider for the maximum number of polygons of the lightning, 0 for no maximum
     cmds.setParent("..")
     
     cmds.frameLayout(borderVisible=True, label="Rendering") #subsection for rendering 
     cmds.button(label = 'Render frame in current path', command = lambda *args: renderFunc(winID)) #button to render the current frame
-    cmds.button(label = 'Batch render in current path', command = lambda *args: batchRenderFunc(winID)) #button to batch render
+    workersControl = cmds.intSliderGrp(label="Render workers", minValue=1, maxValue=16, value=2, step=1, field=True) #slider for the number of renders running at the same time
+    overwriteControl = cmds.checkBoxGrp(label="Overwrite images", value1=True) #checkbox to render again the frames whose images are already in the images folder
+    cmds.button(label = 'Batch render in current path', command = lambda *args: batchRenderFunc(winID, workersControl, overwriteControl)) #button to batch render
     animationControl = cmds.checkBoxGrp(label="Play animation", value1=True) #checkbox to play the animation upon creation of the lightning
+    holdControl = cmds.intSliderGrp(label="Hold frames", minValue=0, maxValue=100, value=20, step=1, field=True) #slider for the number of frames the finished lightning stays visible
+    cmds.setParent("..")
+    
+    cmds.frameLayout(borderVisible=True, label="Profiling") #subsection for timing the Apply
+    profileControl = cmds.checkBoxGrp(label="Profile Apply", value1=profiler.path is not None) #checkbox for timing the phases of the Apply and counting the Maya commands, checked if the LIGHTNING_PROFILE environment variable is set
+    profileFileControl = cmds.textFieldGrp(label="Profile file", text=profiler.path or os.path.join(tempfile.gettempdir(), 'lightningProfile.trace.json')) #field for the file the profile is written to: a .trace.json file can be opened in chrome://tracing
     cmds.setParent("..")
     
     '''Source: reference from Xiaosong Yang'''
     cmds.frameLayout(borderVisible=True, labelVisible=False, h=35)
     cmds.rowLayout(numberOfColumns=2, columnWidth2=[250,250], columnAttach=[(1, "both", 10),(2, "both", 10)])
     #the apply button calls the actionProc() function, thus starting the algorithm
-    cmds.button(label = "Apply", command = lambda *args: actionProc(winID, attractorsNumber, thicknessControl, heightControl, areaControl, rotationControl, scalingControl, segmSizeFalloff, brightnessControl, colourControl, brightnessFalloff, colourFalloff, animationControl))
+    cmds.button(label = "Apply", command = lambda *args: actionProc(winID, attractorsNumber, thicknessControl, heightControl, areaControl, rotationControl, scalingControl, segmSizeFalloff, brightnessControl, colourControl, brightnessFalloff, colourFalloff, animationControl, engineControl, shaderStepsControl, seedControl, newSeedControl, holdControl, maxIterationsControl, timeBudgetControl, 
+                                                                      maxSidesControl, edgeLengthControl, framesPerMeshControl, tipModeControl, tipRadiusControl, polygonBudgetControl, profileControl, profileFileControl))
     cmds.button(label = "Cancel", command = lambda *args: cancelProc(winID)) #the cancel button calls the cancelProc() function, thus deleting the window
     cmds.setParent("..")
     '''End of referenced code'''
     
     cmds.showWindow(winID)
     
+def benchmarkFunc(attrNumbers=(40, 100, 200), areas=(7, 20, 50), heights=(10,), engine='mvector', seed=0, repeats=1):
+    ''' Grows and builds a lightning for every combination of attractors, area and height using the RecordingBackend, so that 
+        the performance can be measured and compared between changes without Maya
+    
+    attrNumbers     : the numbers of attractors to try
+    areas           : the areas to try
+    heights         : the heights of the origin to try
+    engine          : the growth engine
+    seed            : the random seed, the same for every combination so that the results can be compared
+    repeats         : the number of times each combination is timed, the fastest one is kept
+    return          : returns a list with a dictionary of results for every combination
+    '''
+    clock = getattr(time, 'perf_counter', time.time)
+    results = []
+    for attrNumber in attrNumbers:
+        for area in areas:
+            for height in heights:
+                wallTime = None
+                for r in range(repeats):
+                    backend = RecordingBackend()
+                    start = clock()
+                    lightning = Bolt(attrNumber, area, height, engine, seed)
+                    lightning.grow(1, 1, 315, (0.55, 0.55, 1), 1, True, True, True, False, backend=backend)
+                    elapsed = clock() - start
+                    if (wallTime is None or elapsed < wallTime):
+                        wallTime = elapsed
+                        
+                '''The peak memory is measured on a separate run, as tracemalloc slows the growth down. The profiler is off during this run, so that it isn't profiled twice'''
+                peakMemory = None
+                if (tracemalloc is not None):
+                    profiling = profiler.enabled
+                    if (profiling):
+                        profiler.stop()
+                    tracemalloc.start()
+                    Bolt(attrNumber, area, height, engine, seed).grow(1, 1, 315, (0.55, 0.55, 1), 1, True, True, True, False, backend=RecordingBackend())
+                    peakMemory = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    if (profiling):
+                        profiler.start()
+                results.append({'attractors': attrNumber, 'area': area, 'height': height, 'engine': lightning.engine, 'seed': seed,
+                                'wallTime': wallTime, 'iterations': lightning.iterations, 'segments': len(lightning.segmList),
+                                'peakMemory': peakMemory, 'polygons': backend.polygons, 'calls': sum(backend.calls.values())})
+    return results
+    
+def stormBenchmarkFunc(count=16, processes=None, engine='grid', seed=0):
+    ''' Grows a storm without the topology cache and measures how long it takes, so that the scaling with the number of processes can be compared
+    
+    count           : the number of bolts
+    processes       : the number of worker processes, one for every core if it is not given
+    engine          : the growth engine
+    seed            : the random seed of the storm
+    return          : returns a dictionary with the results
+    '''
+    clock = getattr(time, 'perf_counter', time.time)
+    jobs = stormJobs(count, seed, engine=engine)
+    start = clock()
+    topologies = growStorm(jobs, processes, cache=False)
+    wallTime = clock() - start
+    return {'bolts': count, 'processes': processes or multiprocessing.cpu_count(), 'engine': engine, 'seed': seed, 'wallTime': wallTime,
+            'segments': sum(len(topology.parents) for topology in topologies)}
+    
+def printResults(results):
+    ''' Prints the results of benchmarkFunc as a table
+    '''
+    print('%10s %6s %6s %8s %10s %10s %9s %12s %8s' % ('attractors', 'area', 'height', 'engine', 'time (s)', 'iterations', 'segments', 'memory (KB)', 'calls'))
+    for result in results:
+        memory = '-' if result['peakMemory'] is None else str(result['peakMemory']//1024)
+        print('%10d %6d %6g %8s %10.3f %10d %9d %12s %8d' % (result['attractors'], result['area'], result['height'], result['engine'], result['wallTime'], 
+                                                          result['iterations'], result['segments'], memory, result['calls']))
+    
+def commandLineFunc(args):
+    ''' Runs the benchmark from the command line, for example on a machine without Maya:
+        python Lightning_script_final_2.py --attractors 40 200 --areas 7 50 --engine numpy --json results.json
+        python Lightning_script_final_2.py --storm 32 --processes 4
+        python Lightning_script_final_2.py --attractors 200 --areas 20 --profile profile.trace.json
+    
+    args            : the command line arguments
+    On exit         : the results have been printed, and written to a JSON file if one is given
+    '''
+    parser = argparse.ArgumentParser(description='Benchmark of the lightning growth, using a backend that records the calls instead of Maya')
+    parser.add_argument('--attractors', type=int, nargs='+', default=[40, 100, 200], help='the numbers of attractors to try')
+    parser.add_argument('--areas', type=int, nargs='+', default=[7, 20, 50], help='the areas to try')
+    parser.add_argument('--heights', type=float, nargs='+', default=[10], help='the heights of the origin to try')
+    parser.add_argument('--engine', default='mvector', choices=['mvector', 'numpy', 'grid', 'frontier'], help='the growth engine')
+    parser.add_argument('--seed', type=int, default=0, help='the random seed')
+    parser.add_argument('--repeats', type=int, default=1, help='the number of times each combination is timed')
+    parser.add_argument('--json', help='the path of a JSON file the results are written to')
+    parser.add_argument('--storm', type=int, help='grows a storm with this number of bolts instead, see growStorm')
+    parser.add_argument('--processes', type=int, help='the number of worker processes of the storm, one for every core if it is not given')
+    parser.add_argument('--profile', help='the path of a file the phases of the growth and of the build are written to, in the Chrome trace format if it ends in .trace.json')
+    options = parser.parse_args(args)
+    
+    if (options.profile):
+        profiler.path = options.profile
+        profiler.start()
+    if (options.storm):
+        result = stormBenchmarkFunc(options.storm, options.processes, options.engine, options.seed)
+        print('%d bolts, %d segments, %d processes: %.3f s, %.2f bolts/s' % (result['bolts'], result['segments'], result['processes'], result['wallTime'], result['bolts']/result['wallTime']))
+        results = [result]
+    else:
+        results = benchmarkFunc(options.attractors, options.areas, options.heights, options.engine, options.seed, options.repeats)
+        printResults(results)
+    if (options.json):
+        with open(options.json, 'w') as jsonFile:
+            json.dump(results, jsonFile, indent=2)
+    if (profiler.enabled): #the profiler is also on if the LIGHTNING_PROFILE environment variable is set
+        profiler.stop()
+        profiler.write()
+        profiler.printSummary()
+    
 if __name__== "__main__":
-    createUI()
\ No newline at end of file
+    if (sys.argv[1:2] == ['--stand-in-render']): #the RenderDispatcher can run the script as a stand-in for Render
+        standInRenderFunc(sys.argv[2:])
+    elif (cmds is None): #outside of Maya the script runs the benchmark
+        commandLineFunc(sys.argv[1:])
+    else:
+        createUI()
\ No newline at end of file
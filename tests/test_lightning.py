@@ -0,0 +1,396 @@
+''' Regression tests of the growth core, the in-place update and the render dispatcher. They run outside of Maya, using the
+    RecordingBackend instead of the scene, a topology cache in a temporary folder and the stand-in render of the script:
+    python -m pytest tests
+'''
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+scriptPath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Docs', 'Lightning_script_final_2.py')
+spec = importlib.util.spec_from_file_location('Lightning_script_final_2', scriptPath)
+lightning = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(lightning)
+
+
+def lightningSettings(**changes):
+    ''' Returns the settings of the GUI with its default values, changed by the given values
+    '''
+    settings = {'attractors': 60, 'thickness': 1.0, 'height': 10.0, 'area': 10, 'rotation': 315, 'size': 1.0, 'segmFalloff': True,
+                'brightness': 1.0, 'colour': [0.55, 0.55, 1.0], 'brFalloff': True, 'colFalloff': True, 'shaderSteps': 32, 'animation': False,
+                'holdFrames': 20, 'engine': 'grid', 'seed': 3, 'maxIterations': 1000, 'timeBudget': 0.0, 'lod': lightning.LevelOfDetail().settings()}
+    settings.update(changes)
+    return settings
+
+
+class EngineTest(unittest.TestCase):
+    def grow(self, engine, seed, attrNumber=80, area=15, **kwargs):
+        bolt = lightning.Bolt(attrNumber, area, 10, engine, seed, **kwargs)
+        return bolt, bolt.growTopology()
+
+    def assertSameTopology(self, first, second):
+        self.assertEqual(first.parents, second.parents)
+        self.assertEqual(first.positions, second.positions)
+        self.assertEqual(first.frames, second.frames)
+        self.assertEqual(first.iterations, second.iterations)
+
+    def testEnginesGrowTheSameBolt(self):
+        engines = ['grid', 'frontier'] + (['numpy'] if lightning.np is not None else [])
+        for seed in (0, 1, 2):
+            reference = self.grow('mvector', seed)[1]
+            for engine in engines:
+                bolt, topology = self.grow(engine, seed, stallIterations=100000) #the frontier engine only differs when it retires attractors
+                self.assertEqual(bolt.retired, 0)
+                self.assertSameTopology(reference, topology)
+
+    def testSeedRepeatsTheBolt(self):
+        self.assertSameTopology(self.grow('grid', 5)[1], self.grow('grid', 5)[1])
+        self.assertNotEqual(self.grow('grid', 5)[1].positions, self.grow('grid', 6)[1].positions)
+
+    def testIterationBudget(self):
+        bolt, topology = self.grow('grid', 0, maxIterations=5)
+        self.assertEqual(bolt.stopReason, 'iterations')
+        self.assertEqual(topology.iterations, 5)
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testRoundTrip(self):
+        bolt = lightning.Bolt(40, 10, 10, 'grid', 4)
+        topology = bolt.growTopology()
+        cache = lightning.TopologyCache(self.directory)
+        cache.save(bolt.cacheKey(), topology)
+        loaded = cache.load(bolt.cacheKey())
+        self.assertEqual(loaded.parents, topology.parents)
+        self.assertEqual(loaded.frames, topology.frames)
+        self.assertEqual(loaded.iterations, topology.iterations)
+        for loadedValue, value in zip(loaded.positions, topology.positions):
+            self.assertAlmostEqual(loadedValue, value)
+
+    def testVersionIsPartOfTheKey(self):
+        key = lightning.Bolt(40, 10, 10, 'grid', 4).cacheKey()
+        self.assertEqual(key[-1], lightning.topologyVersion)
+        oldKey = key[:-1] + (lightning.topologyVersion-1,)
+        self.assertNotEqual(lightning.TopologyCache(self.directory).path(key), lightning.TopologyCache(self.directory).path(oldKey))
+
+
+class UpdateTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = lightning.topologyCache
+        self.pool = lightning.shaderPool
+        lightning.topologyCache = lightning.TopologyCache(self.directory)
+        lightning.shaderPool = lightning.ShaderPool()
+        self.backend = lightning.RecordingBackend()
+
+    def tearDown(self):
+        lightning.topologyCache = self.cache
+        lightning.shaderPool = self.pool
+        shutil.rmtree(self.directory)
+
+    def apply(self, **changes):
+        self.backend.calls.clear()
+        updated = lightning.applyLightning(lightningSettings(**changes), self.backend)
+        return updated, dict(self.backend.calls)
+
+    def testFirstApplyBuilds(self):
+        updated, calls = self.apply()
+        self.assertFalse(updated)
+        self.assertEqual(calls['createMesh'], calls['keyVisibility'])
+        self.assertEqual(calls['group'], 1)
+
+    def testSameSettingsChangeNothing(self):
+        self.apply()
+        updated, calls = self.apply()
+        self.assertTrue(updated)
+        self.assertEqual(set(calls), set(['getSettings', 'exists', 'setSettings']))
+
+    def testColourEditsTheShaders(self):
+        self.apply()
+        updated, calls = self.apply(colour=[1.0, 0.2, 0.2])
+        self.assertTrue(updated)
+        self.assertEqual(set(calls), set(['getSettings', 'exists', 'nodeId', 'setShaderColour', 'assignShader', 'setSettings']))
+
+    def testThicknessMovesThePoints(self):
+        built = self.apply()[1]
+        updated, calls = self.apply(thickness=2.0)
+        self.assertTrue(updated)
+        self.assertEqual(calls['setMeshPoints'], built['createMesh'])
+        self.assertNotIn('createMesh', calls)
+
+    def testHoldFramesRetimes(self):
+        built = self.apply()[1]
+        updated, calls = self.apply(holdFrames=40)
+        self.assertTrue(updated)
+        self.assertEqual(calls['keyVisibility'], built['keyVisibility'])
+        self.assertEqual(calls['playback'], 1)
+        self.assertNotIn('createMesh', calls)
+
+    def testRotationOnlyTransforms(self):
+        self.apply()
+        updated, calls = self.apply(rotation=90)
+        self.assertTrue(updated)
+        self.assertEqual(set(calls), set(['getSettings', 'exists', 'transformGroup', 'setSettings']))
+
+    def testSeedRebuilds(self):
+        self.apply()
+        updated, calls = self.apply(seed=4)
+        self.assertFalse(updated)
+        self.assertEqual(calls['delete'], 1)
+        self.assertIn('createMesh', calls)
+
+    def testDeletedMeshRebuilds(self):
+        self.apply()
+        self.backend.delete('Lightning_segments_1')
+        updated, calls = self.apply(colour=[1.0, 0.2, 0.2])
+        self.assertFalse(updated)
+        self.assertIn('createMesh', calls)
+
+    def testSharedShadersAreNotRecoloured(self):
+        topologies = lightning.growStorm(lightning.stormJobs(2, attrRange=(30, 60), areaRange=(7, 10)), processes=1, cache=False)
+        settings = lightningSettings()
+        lightning.buildStorm(topologies, settings['thickness'], settings['size'], settings['rotation'], settings['colour'], settings['brightness'],
+                             settings['brFalloff'], settings['colFalloff'], settings['segmFalloff'], settings['animation'], backend=self.backend)
+        self.apply()
+        updated, calls = self.apply(colour=[1.0, 0.2, 0.2]) #the storm uses the same shaders, so the lightning gets new ones
+        self.assertTrue(updated)
+        self.assertNotIn('setShaderColour', calls)
+        self.assertIn('createShader', calls)
+        updated, calls = self.apply(colour=[0.2, 1.0, 0.2]) #the new shaders are only used by the lightning
+        self.assertTrue(updated)
+        self.assertNotIn('createShader', calls)
+        self.assertIn('setShaderColour', calls)
+
+    def testShadersOfAnotherSceneAreNotUsed(self):
+        self.apply() #look A gets the first shading groups
+        self.apply(colour=[1.0, 0.2, 0.2], seed=4) #look B gets the next ones
+        self.backend = lightning.RecordingBackend(log=True) #a new scene in the same session gives the same names to the new nodes
+        self.apply(colour=[1.0, 0.2, 0.2], seed=4)
+        self.backend.delete('Lightning')
+        self.apply()
+        created = [call for call in self.backend.log if call[0] == 'createShader']
+        colours = set(call[2] for call in created)
+        self.assertIn(lightning.shaderPool.shaderColours(0, 32, [0.55, 0.55, 1.0], 1.0, True, True)[0], colours) #look A got its own shaders instead of the ones of look B
+        self.assertNotIn('setShaderColour', self.backend.calls)
+
+    def testStormNamesAreUnique(self):
+        self.backend = lightning.RecordingBackend(log=True)
+        topologies = lightning.growStorm(lightning.stormJobs(3, attrRange=(30, 60), areaRange=(7, 10)), processes=1, cache=False)
+        lightning.buildStorm(topologies, 1, 1, 315, [0.55, 0.55, 1.0], 1, True, True, True, False, backend=self.backend)
+        self.apply()
+        names = [call[1] for call in self.backend.log if call[0] in ('createMesh', 'createCurves')]
+        self.assertEqual(len(names), len(set(names)))
+
+
+class LevelOfDetailTest(unittest.TestCase):
+    def setUp(self):
+        self.topology = lightning.Bolt(80, 15, 10, 'grid', 0).growTopology()
+        self.radii = [0.1 - frame*0.001 for frame in self.topology.frames] #the radius decreases with the frame like in buildTubes, so the thinnest segments are the tips
+
+    def segments(self, chains, kind=None):
+        return sorted(i for bucket, segments, sides, chainKind in chains if kind in (None, chainKind) for i in segments)
+
+    def polygons(self, builder):
+        return sum(len(counts) for points, counts, connects in builder.meshes.values())
+
+    def testFramesPerMeshMergesChains(self):
+        lastFrame = max(self.topology.frames)
+        shown = [i for i in range(len(self.topology.parents)) if self.topology.parents[i] >= 0]
+        single = lightning.LevelOfDetail().plan(self.topology, self.radii, 1.0, 12, lastFrame)[0]
+        merged = lightning.LevelOfDetail(framesPerMesh=4).plan(self.topology, self.radii, 1.0, 12, lastFrame)[0]
+        self.assertEqual(self.segments(single), shown)
+        self.assertEqual(self.segments(merged), shown)
+        self.assertLess(len(merged), len(single))
+        for bucket, segments, sides, kind in merged:
+            self.assertEqual((bucket-1) % 4, 0)
+            self.assertTrue(all(bucket <= self.topology.frames[i] < bucket+4 for i in segments))
+            self.assertTrue(all(self.topology.parents[segments[j]] == segments[j-1] for j in range(1, len(segments)))) #a chain is a single unbranched tube
+        self.assertLess(len(lightning.LevelOfDetail(framesPerMesh=4).build(self.topology, self.radii).meshes), len(lightning.LevelOfDetail().build(self.topology, self.radii).meshes))
+
+    def testSidesFromEdgeLength(self):
+        lod = lightning.LevelOfDetail(maxSides=12, minSides=3, edgeLength=0.05)
+        self.assertEqual(lod.sides(0.04, 1.0, 12), 6)
+        self.assertEqual(lod.sides(0.02, 2.0, 12), 6)
+        self.assertEqual(lod.sides(0.1, 1.0, 12), 12)
+        self.assertEqual(lod.sides(0.01, 1.0, 12), 3)
+        self.assertEqual(lightning.LevelOfDetail(maxSides=8).sides(0.01, 1.0, 8), 8)
+        for bucket, segments, sides, kind in lod.plan(self.topology, self.radii, 1.0, 12, max(self.topology.frames))[0]:
+            self.assertTrue(all(lod.sides(self.radii[i], 1.0, 12) == sides for i in segments))
+
+    def testTipsAreCulledOrCurved(self):
+        lastFrame = max(self.topology.frames)
+        thin = [i for i in range(len(self.topology.parents)) if self.topology.parents[i] >= 0 and self.radii[i] < 0.06]
+        thick = [i for i in range(len(self.topology.parents)) if self.topology.parents[i] >= 0 and self.radii[i] >= 0.06]
+        self.assertTrue(thin)
+        kept = lightning.LevelOfDetail(tipMode='keep', tipRadius=0.06).plan(self.topology, self.radii, 1.0, 12, lastFrame)[0]
+        culled = lightning.LevelOfDetail(tipMode='cull', tipRadius=0.06).plan(self.topology, self.radii, 1.0, 12, lastFrame)[0]
+        curved = lightning.LevelOfDetail(tipMode='curve', tipRadius=0.06).plan(self.topology, self.radii, 1.0, 12, lastFrame)[0]
+        self.assertEqual(self.segments(kept, 'tube'), sorted(thin+thick))
+        self.assertEqual(self.segments(culled), thick)
+        self.assertEqual(self.segments(curved, 'tube'), thick)
+        self.assertEqual(self.segments(curved, 'curve'), thin)
+        self.assertTrue(all(sides == 0 for bucket, segments, sides, kind in curved if kind == 'curve'))
+        self.assertTrue(lightning.LevelOfDetail(tipMode='curve', tipRadius=0.06).build(self.topology, self.radii).curves)
+
+    def testPolygonBudget(self):
+        budget = lightning.LevelOfDetail(minSides=3).plan(self.topology, self.radii, 1.0, 3, 20)[1]
+        for tipMode in ('keep', 'cull', 'curve'):
+            lod = lightning.LevelOfDetail(maxSides=12, minSides=3, tipMode=tipMode, tipRadius=0.06, polygonBudget=budget)
+            builder = lod.build(self.topology, self.radii)
+            self.assertLessEqual(self.polygons(builder), budget)
+            lastFrame = max(builder.meshes)
+            self.assertEqual(lastFrame, 20) #the binary search keeps the most frames that fit in the budget
+            self.assertGreater(lod.plan(self.topology, self.radii, 1.0, 3, lastFrame+1)[1], budget)
+            self.assertEqual(builder.curves, {}) #the frames past the budget are culled even when the tips become curves
+
+
+class MeshBuilderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testWriteObj(self):
+        builder = lightning.buildTubes(lightning.Bolt(20, 10, 10, 'grid', 1).growTopology(), 1.0, True)
+        self.assertGreater(len(builder.meshes), 1)
+        path = os.path.join(self.directory, 'bolt.obj')
+        builder.writeObj(path)
+        objects = []
+        with open(path) as objFile:
+            for line in objFile:
+                values = line.split()
+                if (values[0] == 'o'):
+                    objects.append((values[1], [], []))
+                elif (values[0] == 'v'):
+                    objects[-1][1].append([float(value) for value in values[1:]])
+                else:
+                    objects[-1][2].append([int(value) for value in values[1:]])
+        self.assertEqual([name for name, vertices, faces in objects], ['segments_'+str(key) for key in sorted(builder.meshes)])
+        offset = 0
+        for (name, vertices, faces), key in zip(objects, sorted(builder.meshes)):
+            points, counts, connects = builder.meshes[key]
+            self.assertEqual(len(vertices), len(points)//3)
+            self.assertEqual(len(faces), len(counts))
+            self.assertEqual([len(face) for face in faces], list(counts))
+            self.assertEqual([index for face in faces for index in face], [index+offset+1 for index in connects]) #the indices are 1-based and continue from the vertices of the previous objects
+            self.assertEqual(min(min(face) for face in faces), offset+1)
+            self.assertEqual(max(max(face) for face in faces), offset+len(vertices))
+            for vertex, i in zip(vertices, range(0, len(points), 3)):
+                for value, point in zip(vertex, points[i:i+3]):
+                    self.assertAlmostEqual(value, point, places=5)
+            offset += len(vertices)
+
+
+class ProfilerTest(unittest.TestCase):
+    phases = set(['growth', 'attraction', 'pruning', 'averaging', 'geometry', 'meshes', 'shading', 'keyframing', 'group', 'transform'])
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.profiler = lightning.profiler
+        lightning.profiler = lightning.Profiler()
+        lightning.profiler.start()
+        self.bolt = lightning.Bolt(60, 10, 10, 'grid', 2)
+        self.bolt.grow(1, 1, 315, (0.55, 0.55, 1), 1, True, True, True, False, backend=lightning.RecordingBackend())
+        lightning.profiler.stop()
+
+    def tearDown(self):
+        lightning.profiler = self.profiler
+        shutil.rmtree(self.directory)
+
+    def testReport(self):
+        report = lightning.profiler.report()
+        self.assertEqual(set(report['phases']), self.phases)
+        self.assertEqual(report['phases']['attraction']['calls'], self.bolt.iterations)
+        self.assertEqual(report['phases']['growth']['calls'], 1)
+        self.assertEqual(report['commands']['createMesh'], report['commands']['keyVisibility'])
+        self.assertEqual(len(report['iterations']), self.bolt.iterations)
+        self.assertEqual(report['iterations'][-1]['segments'], len(self.bolt.segmList))
+        self.assertEqual(report['iterations'][-1]['attractors'], 0)
+
+    def testChromeTrace(self):
+        trace = lightning.profiler.chromeTrace()
+        phases = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+        counters = [event for event in trace['traceEvents'] if event['ph'] == 'C']
+        self.assertEqual(set(event['name'] for event in phases), self.phases)
+        self.assertTrue(all(event['dur'] >= 0 for event in phases))
+        self.assertEqual(len(counters), self.bolt.iterations)
+        self.assertEqual(set(counters[-1]['args']), set(['segments', 'attractors']))
+        self.assertIn('createMesh', trace['otherData']['commands'])
+
+    def testWrite(self):
+        tracePath = os.path.join(self.directory, 'profile.trace.json')
+        reportPath = os.path.join(self.directory, 'profile.json')
+        lightning.profiler.write(tracePath)
+        lightning.profiler.write(reportPath)
+        with open(tracePath) as jsonFile:
+            self.assertIn('traceEvents', json.load(jsonFile))
+        with open(reportPath) as jsonFile:
+            self.assertEqual(set(json.load(jsonFile)['phases']), self.phases)
+
+    def testStoppedProfilerCollectsNothing(self):
+        lightning.profiler.reset()
+        lightning.Bolt(40, 10, 10, 'grid', 2).growTopology()
+        self.assertEqual(lightning.profiler.report(), {'phases': {}, 'commands': {}, 'iterations': []})
+
+
+class RenderDispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.progress = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def dispatcher(self, executable, **kwargs):
+        dispatcher = lightning.RenderDispatcher('scene.mb', self.directory, executable=executable, progress=lambda *args: self.progress.append(args), **kwargs)
+        dispatcher.pollInterval = 0.01
+        return dispatcher
+
+    def standIn(self, *args):
+        return [sys.executable, scriptPath, '--stand-in-render'] + list(args)
+
+    def testRendersSkipsAndRetries(self):
+        open(os.path.join(self.directory, 'lightning.0002.iff'), 'w').close() #an image from a render that was stopped
+        result = self.dispatcher(self.standIn('-fail', '9', '-failOnce', '5'), workers=2, chunkSize=3).run(1, 10)
+        self.assertEqual(result['skipped'], [2])
+        self.assertEqual(result['rendered'], [1, 3, 4, 5, 6, 7, 8, 10])
+        self.assertEqual(result['failed'], [9])
+        self.assertIsNone(result['error'])
+        self.assertEqual(self.progress[-1], (9, 10, [9]))
+
+    def testOverwriteRendersAgain(self):
+        open(os.path.join(self.directory, 'lightning.0002.iff'), 'w').close() #an image of a previous batch render
+        result = self.dispatcher(self.standIn(), overwrite=True).run(1, 3)
+        self.assertEqual(result['skipped'], [])
+        self.assertEqual(result['rendered'], [1, 2, 3])
+        with open(os.path.join(self.directory, 'lightning.0002.iff')) as imageFile:
+            self.assertIn('frame 2', imageFile.read())
+
+    def testOverwriteDoesntKeepOldImagesOfFailedFrames(self):
+        open(os.path.join(self.directory, 'lightning.0002.iff'), 'w').close()
+        result = self.dispatcher(self.standIn('-fail', '2'), overwrite=True, retries=0).run(1, 3)
+        self.assertEqual(result['failed'], [2])
+
+    def testFailedFrameIsRetried(self):
+        result = self.dispatcher(self.standIn('-fail', '3'), retries=1, chunkSize=5).run(1, 5)
+        self.assertEqual(result['failed'], [3])
+        self.assertEqual(len(self.progress), 2) #the chunk, then frame 3 on its own
+
+    def testMissingRendererIsReported(self):
+        result = self.dispatcher([os.path.join(self.directory, 'missingRender')]).run(1, 4)
+        self.assertEqual(result['failed'], [1, 2, 3, 4])
+        self.assertIsInstance(result['error'], OSError)
+        self.assertIsInstance(self.progress[-1][3], OSError)
+
+
+if __name__ == '__main__':
+    unittest.main()